@@ -173,6 +173,13 @@ sub init {
 	## Initialize Database Handle ##
 	$self->dbh( DBI->connect( 'dbi:SQLite:dbname=' . $self->db_file, '', '', { RaiseError => 1 } ) ) if ($self->db_file);
 
+	## Share the Database with the Web App: WAL so its Readers never wait on our Writes, and wait for its Writes ##
+	if ($self->dbh) {
+		$self->dbh->sqlite_busy_timeout( 5000 );
+		$self->dbh->do( 'PRAGMA journal_mode = WAL' );
+		$self->dbh->do( 'PRAGMA synchronous = NORMAL' );
+	}
+
 	$self->profile->stop('SiteMonitor::init') if ($self->environment->profile);
 }
 
@@ -350,6 +357,7 @@ sub a10_hosts {
 				$sth->execute();
 			} else {
 				print 'inserting[' . join(']==[', $row->{'address'}, $row->{'port'}, $row->{'status'}, $address->{'host'}, $vip) . "]\n";
+				## HOST is Collector-owned and excluded from ID_BLOCK: its Ids are max(host_id)+1, as the Web App's Host.getMaxId ##
 				$sth = $self->dbh->prepare("SELECT max(host_id) AS MAX FROM host;");
 				$sth->execute();
 				my $res = $sth->fetchrow_hashref;
@@ -2,13 +2,14 @@
 import os
 
 from genshi.template import TemplateLoader
+from paste.deploy.converters import asbool
 from pylons.configuration import PylonsConfig
-from sqlalchemy import engine_from_config
 
 import sitemonitor.lib.app_globals as app_globals
 import sitemonitor.lib.helpers
 from sitemonitor.config.routing import make_map
-from sitemonitor.model import init_model
+from sitemonitor.model import init_model, ids
+from sitemonitor.model.engines import newEngine
 
 def load_environment(global_conf, app_conf):
     """Configure the Pylons environment via the ``pylons.config``
@@ -35,8 +36,18 @@ def load_environment(global_conf, app_conf):
         paths['templates'], auto_reload=True)
 
     # Setup the SQLAlchemy database engine
-    engine = engine_from_config(config, 'sqlalchemy.')
-    init_model(engine)
+    engine  = newEngine(config, 'sqlalchemy.')
+    replica = None
+    if config.get('replica.sqlalchemy.url'):
+        replica = newEngine(config, 'replica.sqlalchemy.')
+    init_model(engine, replica, config.get('replica.sticky', 5))
+
+    # Hand out primary keys from blocks reserved once per process
+    ids.ALLOCATOR.configure(engine, config.get('ids.source', 'auto'), config.get('ids.block', 100))
+
+    # Keep the Health Check status store warm in the background
+    if asbool(config.get('healthcheck.scheduler', False)):
+        config['pylons.app_globals'].scheduler.start()
 
     # Optionally, if removing the CacheMiddleware and using the
     # cache in the new 1.0 style, add under the previous lines:
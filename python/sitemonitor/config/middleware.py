@@ -57,6 +57,9 @@ def make_app(global_conf, full_stack=True, static_files=True, **app_conf):
         else:
             app = StatusCodeRedirect(app, [400, 401, 403, 404, 500])
 
+        # Let the event streams through the error handler as they are written
+        app = EventStreams(app)
+
     # Establish the Registry for this application
     app = RegistryManager(app)
 
@@ -67,3 +70,18 @@ def make_app(global_conf, full_stack=True, static_files=True, **app_conf):
 
     app.config = config
     return app
+
+
+class EventStreams(object):
+    """ the debug error handler reads a whole response before it sends any of it, which holds
+        the /monitor/events stream back until it ends, its requests skip the error handlers
+    """
+
+    def __init__(self, app, prefix='/monitor/events'):
+        self.app    = app
+        self.prefix = prefix
+
+    def __call__(self, environ, start_response):
+        if environ.get('PATH_INFO', '').startswith(self.prefix):
+            environ['paste.throw_errors'] = True
+        return self.app(environ, start_response)
@@ -1,18 +1,19 @@
+import hashlib
 import logging
 import simplejson as json
 import datetime as date
 import sitemonitor.lib.helpers as h
 
-from sqlalchemy.exceptions import InvalidRequestError
+from sqlalchemy.exc import InvalidRequestError
 from pylons import request, response, session, tmpl_context as c
 from pylons.controllers.util import abort, redirect
 from pylons.decorators.rest import restrict
 from pylons.decorators import jsonify
-from pylons import config, url
+from pylons import config, url, app_globals
 
-from sitemonitor.lib.base import BaseController, render
+from sitemonitor.lib.base import BaseController, render, readonly
 #from sitemonitor.lib.authorization import AuthorizationControl
-from sitemonitor.model import Site, Host, Monitor
+from sitemonitor.model import Site, Monitor, HealthRollup
 from sitemonitor.model.meta import Session as db
 
 from webhelpers.pylonslib import Flash as _Flash
@@ -21,24 +22,38 @@ log    = logging.getLogger(__name__)
 
 class AdminController(BaseController):
     """view of all of the fixed rates and values"""
+    @readonly
 #    @AuthorizationControl('index')
     def index(self, limitText='limit', limit=10, offsetText='offset', offset=0):
         log.debug('index')
         log.debug("fetching Service data")
-        siteObject = Site()
-        c.limit    = int(limit)
-        c.offset   = int(offset)
-        c.user     = getUser()
-        c.sites    = siteObject.getSet(c.limit, c.offset)
-        c.total    = siteObject.getTotal()
+        """ pages by site id, /admin/index/limit/10/after/20 is the page after site 20 and
+            /admin/index/limit/10/before/21 the page before site 21
+        """
+        c.limit      = int(limit)
+        c.offset     = int(offset)
+        c.offsetText = offsetText in ('after', 'before') and offsetText or 'after'
+        c.user       = getUser()
+        if offsetText == 'before':
+            c.sites, more = Site().getPage(c.limit, before=c.offset, load=('hosts', 'monitors'))
+        elif offsetText == 'after' or not c.offset:
+            c.sites, more = Site().getPage(c.limit, after=c.offset or None, load=('hosts', 'monitors'))
+        else:
+            """ an old offset link, the first page after the site at that offset """
+            c.sites = Site().getSet(c.limit, c.offset, load=('hosts', 'monitors'))
+            more    = len(c.sites) == c.limit
+            c.offset = c.sites and c.sites[0].id - 1 or 0
+        c.total    = app_globals.sites.getCount()
         c.monitors = Monitor().getAll()
-        c.vips     = Host().getVipNames()
+        c.vips     = app_globals.vips.getVips()
+        c.counts   = dict([ (vip, app_globals.vips.getCounts(vip)) for vip in c.vips ])
         c.length   = len(c.sites)
-        self._prev_next()
+        self._prev_next(more)
         return render('admin.html')
 
     @jsonify
     @restrict('GET')
+    @readonly
     def monitor(self, id=None):
         log.debug('monitor')
         """ json data for monitors or a single monitor """
@@ -56,36 +71,52 @@ class AdminController(BaseController):
                 objects.append(self._monitor_to_json(monitorObject))
             result = { 'monitors': objects }
         log.debug(result)
+        self._etag_result(result)
         return result
 
     @jsonify
     @restrict('GET')
+    @readonly
     def site(self, id=None):
         log.debug('site')
-        """ json data for sites or a single site """
+        """ json data for sites or a single site, with the host status the collector keeps,
+            so the ETag is of the data itself and saves only the transfer
+        """
         result = ''
         if id:
             log.debug("fetching Site data for ID: %s"%id)
             siteId     = int(id)
-            siteObject = Site().getById(siteId)
+            siteObject = Site().getById(siteId, load=('hosts', 'monitors'))
             result     = { 'site': self._site_to_json(siteObject) }
         else:
             log.debug("fetching All Site data")
-            siteObjects = Site().getAll()
+            params = request.params
+            if params.get('limit'):
+                """ a page after the site id in after, next is the after of the page that follows """
+                after = params.get('after') and int(params['after']) or None
+                siteObjects, more = Site().getPage(int(params['limit']), after=after, load=('hosts', 'monitors'))
+            else:
+                siteObjects, more = Site().getAll(load=('hosts', 'monitors')), False
             objects     = [ ]
             for siteObject in siteObjects:
                 objects.append(self._site_to_json(siteObject))
             result = { 'sites': objects }
+            if params.get('limit'):
+                result['next']  = more and siteObjects[-1].id or None
+                result['total'] = app_globals.sites.getCount()
         log.debug(result)
+        self._etag_result(result)
         return result
 
     @jsonify
     @restrict('GET')
+    @readonly
     def host(self, country="US", name=None):
         log.debug('host')
         log.debug("Getting Hosts for country: %s and VIP: %s"%(country, name))
-        hosts = Host().getByVip(name)
-        names = [ ]
+        hosts   = app_globals.vips.getMembers(name)
+        uptimes = HealthRollup().getUptimes([ host.id for host in hosts ], 30)
+        names   = [ ]
         for host in hosts:
             names.append({
                 'id': host.id,
@@ -93,10 +124,13 @@ class AdminController(BaseController):
                 'port': host.port,
                 'name': host.name,
                 'status': host.status,
+                'latency': app_globals.status.getLatency(host.id),
+                'uptime': uptimes.get(host.id),
                 'label': '%s (%d)'%(host.name, host.id)
             })
-        result = { 'hosts': names }
+        result = { 'hosts': names, 'counts': app_globals.vips.getCounts(name) }
         log.debug(result)
+        self._etag_result(result)
         return result
 
     @jsonify
@@ -273,6 +307,7 @@ class AdminController(BaseController):
             elif params['action'] == 'deleted':
                 object.deleteObject()
             db.commit()
+            app_globals.siteVersion.bump()
             message = {
                 'status':  200,
                 'form': params['form'],
@@ -418,25 +453,25 @@ class AdminController(BaseController):
                 })
         return result
 
-    def _prev_next(self):
-        log.debug("Total: %s, Length: %s, Limit: %s, Offset: %s"%(c.total, c.length, c.limit, c.offset))
-        """ prev values """
-        if c.offset:
-            log.debug("prev: Offset: %s > 0"%(c.offset))
-            c.prev = c.offset - c.limit
-        if c.prev < 0:
-            log.debug("prev: Prev: %s < 0"%(c.prev))
-            c.prev = 0
-        """ next values """
-        if c.length < c.limit:
-            log.debug("next: Length: %s < Limit: %s"%(c.length, c.limit))
-            c.next = 0
-        elif c.total == (c.offset + c.limit):
-            log.debug("next: Total: %s == Offset: %s + Limit: %s"%(c.total, c.offset, c.limit))
-            c.next = 0
-        elif c.total > c.limit:
-            log.debug("next: Total: %s > Limit: %s"%(c.total, c.limit))
-            c.next = c.limit + c.offset
+    def _etag_result(self, result):
+        """ answers 304 Not Modified when the client already has this json """
+        self._etag(hashlib.md5(json.dumps(result, sort_keys=True)).hexdigest())
+
+    def _prev_next(self, more=False):
+        """ the site ids the prev and next links page before and after, 0 when there is no such page,
+            more is whether there are sites past this page in the direction it was paged
+        """
+        log.debug("Total: %s, Length: %s, Limit: %s, %s: %s, More: %s"%(c.total, c.length, c.limit, c.offsetText, c.offset, more))
+        c.prev = 0
+        c.next = 0
+        if not c.sites:
+            return
+        if c.offsetText == 'before':
+            c.prev = more and c.sites[0].id or 0
+            c.next = c.sites[-1].id
+        else:
+            c.prev = c.offset and c.sites[0].id or 0
+            c.next = more and c.sites[-1].id or 0
 
     def _log_version(self, id, action, new_json_string, old_json_string):
         return
@@ -1,20 +1,21 @@
 import os
+import time
 import string
 import logging
 import simplejson as json
 import datetime as date
 import sitemonitor.lib.helpers as h
 
-from sqlalchemy.exceptions import InvalidRequestError
+from sqlalchemy.exc import InvalidRequestError
 from pylons import request, response, session, tmpl_context as c
 from pylons.controllers.util import abort, redirect
 from pylons.decorators.rest import restrict
 from pylons.decorators import jsonify
-from pylons import config, url
+from pylons import config, url, app_globals
 
-from sitemonitor.lib.base import BaseController, render
+from sitemonitor.lib.base import BaseController, render, readonly
 #from sitemonitor.lib.authorization import AuthorizationControl
-from sitemonitor.model import Site, Monitor, Preference
+from sitemonitor.model import Site, Host, Monitor, Preference
 from sitemonitor.model.meta import Session as db
 
 from webhelpers.pylonslib import Flash as _Flash
@@ -24,70 +25,143 @@ log    = logging.getLogger(__name__)
 class MonitorController(BaseController):
     """view of all of the Sites to Monitor"""
     @restrict('GET')
+    @readonly
     def index(self, country="US", name=None):
         log.debug('index')
         c.user  = getUser()
-        c.sites = Site().getAll()
+        c.sites = app_globals.sites.getAll()
         if name:
-            c.site = Site().getByCountryName(country, name)
-            prefs  = Preference().getBySiteId(c.site.id)
-            if prefs:
-                c.prefs = prefs.getData()
+            c.site  = self._getSite(country, name)
+            c.prefs = app_globals.preferences.get(c.site.id)
         c.info_messages = flash.pop_messages()
         return render('index.html')
 
     @restrict('GET')
+    @readonly
     def healthcheck(self, country="US", name=None):
         log.debug('healthcheck')
         log.debug("Getting Health Checks for country: %s %s"%(country,name))
-        if name:
-            c.site  = Site().getByCountryName(country, name)
-            c.hosts = c.site.hosts
-            prefs   = Preference().getBySiteId(c.site.id)
-            if prefs:
-                c.prefs = prefs.getData()
+        site = name and self._getSite(country, name) or None
+        self._etag(app_globals.sites.getVersion(), app_globals.status.getVersion(site and site.hostIds))
+        if site:
+            c.site    = site
+            c.hosts   = Host().getByIds(c.site.hostIds)
+            c.health  = app_globals.status.checkHosts(c.hosts)
+            c.latency = dict([ (host.id, app_globals.status.getLatency(host.id)) for host in c.hosts ])
+            c.prefs   = app_globals.preferences.get(c.site.id)
         c.info_messages = flash.pop_messages()
         return render('health-check.html')
 
     @restrict('GET')
+    @readonly
     def splunk(self, country="US", name=None):
         log.debug('splunk')
         log.debug("Getting Splunk Data for country: %s %s"%(country,name))
+        self._etag(app_globals.sites.getVersion())
         if name:
-            c.site  = Site().getByCountryName(country, name)
-            c.hosts = c.site.hosts
-            prefs   = Preference().getBySiteId(c.site.id)
-            if prefs:
-                c.prefs = prefs.getData()
+            c.site  = self._getSite(country, name)
+            c.prefs = app_globals.preferences.get(c.site.id)
         c.info_messages = flash.pop_messages()
         return render('splunk.html')
 
     @restrict('GET')
+    @readonly
     def graphite(self, country="US", name=None):
         log.debug('graphite')
         log.debug("Getting Splunk Data for country: %s %s"%(country,name))
+        self._etag(app_globals.sites.getVersion())
         if name:
-            c.site  = Site().getByCountryName(country, name)
-            c.hosts = c.site.hosts
-            prefs   = Preference().getBySiteId(c.site.id)
-            if prefs:
-                c.prefs = prefs.getData()
+            c.site  = self._getSite(country, name)
+            c.prefs = app_globals.preferences.get(c.site.id)
         c.info_messages = flash.pop_messages()
         return render('graphite.html')
 
     @restrict('GET')
+    @readonly
     def keynote(self, country="US", name=None):
         log.debug('keynote')
         log.debug("Getting Keynote Data for country: %s %s"%(country,name))
+        self._etag(app_globals.sites.getVersion())
         if name:
-            c.site  = Site().getByCountryName(country, name)
-            c.hosts = c.site.hosts
-            prefs   = Preference().getBySiteId(c.site.id)
-            if prefs:
-                c.prefs = prefs.getData()
+            c.site  = self._getSite(country, name)
+            c.prefs = app_globals.preferences.get(c.site.id)
         c.info_messages = flash.pop_messages()
         return render('keynote.html')
 
+    @jsonify
+    @restrict('GET')
+    @readonly
+    def status(self, id=None):
+        log.debug('status')
+        """ json status of every site and host from the status store, filtered by country code or VIP,
+            /monitor/status/US is the same as /monitor/status?country=US
+        """
+        params  = request.params
+        country = id or params.get('country')
+        """ the hosts of the country's sites from the registry, a VIP's are among them """
+        hostIds = [ hostId for site in app_globals.sites.getAll() if not country or site.countryCode == country for hostId in site.hostIds ]
+        self._etag(app_globals.sites.getVersion(), app_globals.status.getVersion(hostIds, metrics=True))
+        rows    = Site().getStatusRows(country, params.get('vip'))
+        health  = app_globals.status.getMany([ row.hostId for row in rows if row.hostId ])
+        sites   = [ ]
+        site    = None
+        for row in rows:
+            if not site or site['id'] != row.siteId:
+                site = {
+                    'id': row.siteId,
+                    'name': row.siteName,
+                    'endPoint': '%s/%s'%(row.countryCode, row.endPoint),
+                    'countryCode': row.countryCode,
+                    'ok': 0,
+                    'total': 0,
+                    'hosts': [ ],
+                }
+                sites.append(site)
+            if not row.hostId:
+                continue
+            site['hosts'].append(self._status_to_json(row, health.get(row.hostId)))
+            site['total'] += 1
+            if site['hosts'][-1]['status'] == 1:
+                site['ok'] += 1
+        return { 'sites': sites, 'metrics': app_globals.status.getMetrics() }
+
+    @restrict('GET')
+    def events(self):
+        log.debug('events')
+        """ server-sent events of host and site status transitions,
+            ?poll=1 long-polls for json instead for browsers without EventSource,
+            each holds a worker thread so only healthcheck.events.streams are held at once
+            and the rest are told to come back in healthcheck.events.retry seconds
+        """
+        params = request.params
+        store  = app_globals.status
+        since  = request.headers.get('Last-Event-ID') or params.get('since')
+        if since:
+            try:
+                since = int(since)
+            except ValueError:
+                """ not a sequence of ours, replay the log """
+                since = 0
+        else:
+            since = store.getSequence()
+        retry  = int(config.get('healthcheck.events.retry', 10))
+        response.headers['Cache-Control'] = 'no-cache'
+        if params.get('poll'):
+            response.headers['Content-Type'] = 'application/json'
+            if not app_globals.followers.acquire(False):
+                return json.dumps({ 'since': since, 'events': [ ], 'retry': retry })
+            try:
+                events = store.waitEvents(since, float(config.get('healthcheck.events.wait', 20)))
+            finally:
+                app_globals.followers.release()
+            return json.dumps({ 'since': events and events[-1]['seq'] or since, 'events': events })
+        response.headers['Content-Type'] = 'text/event-stream'
+        """ the stream runs after the request's registry is gone, so it gets the slot and the store from here """
+        followers = app_globals.followers
+        if not followers.acquire(False):
+            return 'retry: %d\n\n'%(retry * 1000)
+        return self._stream_events(followers, store, since, float(config.get('healthcheck.events.duration', 20)))
+
     @jsonify
     @restrict('POST')
     def preferences(self):
@@ -105,6 +179,7 @@ class MonitorController(BaseController):
         log.debug(result)
         json_string = json.dumps(result)
         Preference().save(params['site'], json_string)
+        app_globals.preferences.invalidate(params['site'])
         log.debug(json_string)
         return json_string
 
@@ -152,13 +227,50 @@ class MonitorController(BaseController):
 
 ## these probably belong in a util class, 
 ## but methods prefixed with "_" are private and not exposed as controller actions
-    def _get_health_check(self, hosts):
-        result = [ ]
-        for host in hosts:
-            status = host.getHealthCheck()
-            print '==== host [%s] = [%s]'%(host.name, status)
-            result.append({'host': host.name, 'staus': status})
-        return result
+    def _getSite(self, country=None, name=None):
+        """ the site's snapshot from the site registry, 404 if there is no such site """
+        site = app_globals.sites.get(country, name)
+        if not site:
+            abort(404)
+        return site
+
+    def _stream_events(self, followers, store, since, duration):
+        """ yields the events as they happen, the browser reconnects with Last-Event-ID after duration,
+            the followers slot taken by events is released however the server closes the stream,
+            nothing here may use app_globals or the other request globals
+        """
+        try:
+            expires = time.time() + duration
+            yield 'retry: 1000\n\n'
+            while time.time() < expires:
+                events = store.waitEvents(since, min(15, expires - time.time()))
+                if not events:
+                    yield ': keep-alive\n\n'
+                    continue
+                for event in events:
+                    yield 'id: %d\nevent: %s\ndata: %s\n\n'%(event['seq'], event['type'], json.dumps(event))
+                since = events[-1]['seq']
+        finally:
+            followers.release()
+
+    def _status_to_json(self, row=None, result=None):
+        """ dump a host row and its health check result to json """
+        data = {
+            'id': row.hostId,
+            'name': row.hostName,
+            'port': row.hostPort,
+            'vip': row.vip,
+            'status': None,
+            'latency': None,
+            'checked': None,
+            'error': None,
+        }
+        if result:
+            data['status']  = result['status']
+            data['latency'] = result['latency']
+            data['checked'] = result['checked']
+            data['error']   = result['error']
+        return data
 
     def _str_to_date(self, strdate):
         """ return a datetime obj from a string """
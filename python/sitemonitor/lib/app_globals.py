@@ -1,4 +1,12 @@
 """The application's Globals object"""
+import time
+import logging
+import threading
+import datetime as date
+
+from paste.deploy.converters import asbool
+
+log = logging.getLogger(__name__)
 
 class Globals(object):
 
@@ -17,4 +25,165 @@ class Globals(object):
         from beaker.cache import CacheManager
         from beaker.util import parse_cache_config_options
 
-        self.cache = CacheManager(**parse_cache_config_options(config))
\ No newline at end of file
+        from sitemonitor.lib.cache import Preferences, SiteRegistry, Version
+        from sitemonitor.lib.catalog import VipCatalog
+        from sitemonitor.lib.connectionpool import ConnectionPool
+        from sitemonitor.lib.healthcheck import HealthCheck, StatusStore, Scheduler
+        from sitemonitor.lib.supervisor import Supervisor
+
+        interval = float(config.get('healthcheck.interval', 30))
+
+        self.cache = CacheManager(**parse_cache_config_options(config))
+        self.siteVersion = Version()
+        self.sites = SiteRegistry(loadSites, self.siteVersion, config.get('sites.maxage', 300))
+        self.preferences = Preferences(loadPreferences, config.get('preferences.maxage', 300))
+        self.resolver = newResolver(config)
+        self.pool  = ConnectionPool(
+            config.get('healthcheck.pool.size', 4),
+            config.get('healthcheck.pool.idle', 60),
+            resolver=self.resolver)
+        self.breaker  = newBreaker(config)
+        self.matcher  = newMatcher(config)
+        self.healthcheck = HealthCheck(
+            config.get('healthcheck.threads', 10),
+            config.get('healthcheck.deadline', 5),
+            self.pool, self.breaker, self.matcher)
+        """ with the scheduler running a request never probes, it shows what the store has """
+        live           = not asbool(config.get('healthcheck.scheduler', False))
+        self.status    = StatusStore(live and self.healthcheck or None, interval * 2)
+        self.vips      = VipCatalog(loadVipHosts, self.siteVersion, interval * 2)
+        self.status.addListener(self.vips.setStatus)
+        """ the /monitor/events streams and long-polls that may hold a worker thread at once """
+        self.followers = threading.Semaphore(int(config.get('healthcheck.events.streams', 4)))
+        workers        = int(config.get('healthcheck.workers', 0))
+        if workers:
+            probes = Supervisor(workers, lambda: newHealthCheck(config, interval, workers), interval)
+        else:
+            probes = HealthCheck(config.get('healthcheck.scheduler.threads', 20), interval,
+                                 self.pool, self.breaker, self.matcher, newPacer(config, interval))
+        self.scheduler = Scheduler(
+            probes, self.status, loadHosts, interval,
+            asbool(config.get('healthcheck.history', False)) and newRecorder(config) or None, self.vips)
+
+
+def newBreaker(config):
+    from sitemonitor.lib.breaker import Breaker
+    return Breaker(
+        minTimeout=config.get('healthcheck.timeout.min', 0.25),
+        maxTimeout=config.get('healthcheck.timeout.max', 2),
+        margin=config.get('healthcheck.timeout.margin', 0.25),
+        failures=config.get('healthcheck.breaker.failures', 3),
+        backoff=config.get('healthcheck.breaker.backoff', 5),
+        maxBackoff=config.get('healthcheck.breaker.backoff.max', 300))
+
+
+def newResolver(config):
+    from sitemonitor.lib.resolver import Resolver
+    return Resolver(
+        ttl=config.get('healthcheck.dns.ttl', 300),
+        negativeTtl=config.get('healthcheck.dns.negative', 30),
+        refresh=config.get('healthcheck.dns.refresh', 0.8),
+        timeout=config.get('healthcheck.dns.timeout', 0.5))
+
+
+def newMatcher(config):
+    """ the pattern every health check page is scanned for, the scheduler's results are only
+        good for one pattern so there is no per Monitor override
+    """
+    from sitemonitor.lib.healthcheck import Matcher, TOKEN
+    return Matcher(config.get('healthcheck.match', TOKEN), config.get('healthcheck.maxbytes', 65536), name='healthcheck')
+
+
+def newPacer(config, interval, workers=1):
+    """ the scheduler's pacer, each of the workers gets its share of the rate budgets """
+    from sitemonitor.lib.pacer import Pacer
+    return Pacer(interval,
+        spread=config.get('healthcheck.spread', 0.8),
+        rate=float(config.get('healthcheck.rate', 0)) / workers,
+        vipRate=float(config.get('healthcheck.rate.vip', 0)) / workers)
+
+
+def newHealthCheck(config, deadline, workers=1):
+    """ the HealthCheck of a probe worker process, with its own connection pool, breaker and pacer """
+    from sitemonitor.lib.connectionpool import ConnectionPool
+    from sitemonitor.lib.healthcheck import HealthCheck
+    return HealthCheck(
+        config.get('healthcheck.scheduler.threads', 20), deadline,
+        ConnectionPool(config.get('healthcheck.pool.size', 4), config.get('healthcheck.pool.idle', 60),
+                       resolver=newResolver(config)),
+        newBreaker(config), newMatcher(config), newPacer(config, deadline, workers))
+
+
+def loadHosts():
+    """ every site reference to a host, loaded in the scheduler's own session """
+    from sitemonitor.model import Host, meta
+    try:
+        return Host().getProbeTargets()
+    finally:
+        meta.Session.remove()
+
+
+def loadSites():
+    """ a snapshot of every site for the site registry """
+    from sitemonitor.model import Site
+    return Site().getSnapshots()
+
+
+def loadPreferences(siteId):
+    """ the decoded preferences of a site for the preferences cache """
+    from sitemonitor.model import Preference
+    return Preference().getDataBySiteId(siteId)
+
+
+def loadVipHosts():
+    """ the host rows for the VIP catalog when the scheduler is not syncing it, in the request's session """
+    from sitemonitor.model import Host
+    return Host().getProbeTargets()
+
+
+def newRecorder(config):
+    return HistoryRecorder(
+        raw=config.get('healthcheck.history.raw', 2),
+        minute=config.get('healthcheck.history.minute', 7),
+        hour=config.get('healthcheck.history.hour', 90),
+        every=config.get('healthcheck.history.purge', 3600))
+
+
+class HistoryRecorder:
+    """ the scheduler's recorder, writes each cycle of results to the health check history and its
+        rollups, and every so many seconds purges the raw samples, minute and hour rollups older
+        than their retention in days, the daily rollups are kept
+    """
+
+    def __init__(self, raw=2, minute=7, hour=90, every=3600):
+        self.retention = { 'raw': float(raw), 'minute': float(minute), 'hour': float(hour) }
+        self.every     = float(every)
+        self.purged    = 0
+
+    def __call__(self, results):
+        """ write a cycle of results to the health check history and its rollups """
+        from sitemonitor.model import HealthHistory, meta
+        try:
+            HealthHistory().recordResults(results)
+            meta.Session.commit()
+        finally:
+            meta.Session.remove()
+        if time.time() - self.purged >= self.every:
+            self.purge()
+
+    def purge(self, now=None):
+        """ returns the number of raw samples and rollups deleted """
+        from sitemonitor.model import HealthHistory, HealthRollup, meta
+        now = now or date.datetime.now()
+        def before(key):
+            return now - date.timedelta(days=self.retention[key])
+        try:
+            deleted  = HealthHistory().purge(before('raw'))
+            deleted += HealthRollup().purge(HealthRollup.MINUTE, before('minute'))
+            deleted += HealthRollup().purge(HealthRollup.HOUR, before('hour'))
+            meta.Session.commit()
+        finally:
+            meta.Session.remove()
+        self.purged = time.time()
+        log.info("Health Check history purged %d rows"%deleted)
+        return deleted
@@ -1,8 +1,11 @@
 """The base Controller API
 
-Provides the BaseController class for subclassing.
+Provides the BaseController class for subclassing, and the readonly
+decorator for the actions whose queries may go to the replica.
 """
+from decorator import decorator
 from pylons.controllers import WSGIController
+from pylons.controllers.util import etag_cache
 from pylons.templating import render_genshi as render
 
 from sitemonitor.model import meta
@@ -18,3 +21,18 @@ class BaseController(WSGIController):
             return WSGIController.__call__(self, environ, start_response)
         finally:
             meta.Session.remove()
+
+    def _etag(self, *versions):
+        """ answers 304 Not Modified, before any query runs, when the client already has these versions """
+        etag_cache('-'.join([ str(version) for version in versions ]))
+
+
+@decorator
+def readonly(func, *args, **kwargs):
+    """ the action only reads, its queries go to the replica unless it writes or the primary was just written """
+    db = meta.Session()
+    db.readOnly = True
+    try:
+        return func(*args, **kwargs)
+    finally:
+        db.readOnly = False
@@ -0,0 +1,235 @@
+"""Health check benchmarks
+
+Measures the health check client against local stub backends, run with:
+
+    python -m sitemonitor.lib.benchmark pool
+    python -m sitemonitor.lib.benchmark healthcheck --hosts 200 --sites 20 \\
+        --mix fast=70,slow=10,hang=5,flap=10,large=5 --output results.json
+
+The healthcheck benchmark seeds HOST and SITE_HOST with one stub backend
+per host, requests every site's health check panel through the whole
+application and writes probes/sec, probe latency percentiles and the
+wall time of each panel as JSON, so runs can be compared across versions.
+"""
+import os
+import sys
+import time
+import datetime as date
+import simplejson as json
+
+from optparse import OptionParser
+
+from sitemonitor.lib.connectionpool import ConnectionPool
+from sitemonitor.lib.healthcheck import probe
+from sitemonitor.lib.stubs import MODES, StubServer, newStub
+
+BASE_ID = 800000
+COUNTRY = 'ZZ'
+MIX     = 'fast=70,slow=10,hang=5,flap=10,large=5'
+
+def benchmarkPool(requests=500):
+    """ latency of the same probe() with the pool off, a pool that keeps no idle connection so
+        every probe connects, and on, a keep-alive pool, matcher and resolver included in both
+    """
+    server = StubServer().start()
+    result = { 'connections': { } }
+    try:
+        for name, pool in (('fresh', ConnectionPool(maxIdle=0)), ('pooled', ConnectionPool())):
+            connections = server.connections
+            start = time.time()
+            for i in range(requests):
+                probe('127.0.0.1', server.port, pool)
+            result[name] = (time.time() - start) / requests
+            result['connections'][name] = server.connections - connections
+            pool.clear()
+    finally:
+        server.stop()
+    return result
+
+
+def benchmarkHealthCheck(app, hosts=100, sites=10, mix=MIX, rounds=3):
+    """ drive the health check panels of sites seeded with stub backends, app is a webtest TestApp of loadApp(),
+        every round starts from an empty status store so each panel probes its hosts
+    """
+    globals = app.app.config['pylons.app_globals']
+    store   = globals.status
+    modes   = parseMix(mix, hosts)
+    stubs   = [ newStub(mode) for mode in modes ]
+    report  = {
+        'version': getVersion(),
+        'started': date.datetime.now().isoformat(),
+        'python': sys.version.split()[0],
+        'parameters': { 'hosts': hosts, 'sites': sites, 'mix': mix, 'rounds': rounds },
+        'rounds': [ ],
+    }
+    try:
+        seedSites(stubs, modes, sites)
+        globals.siteVersion.bump()
+        for i in range(rounds):
+            report['rounds'].append(runRound(app, store, stubs, modes, sites))
+    finally:
+        for stub in stubs:
+            stub.stop()
+        removeSites(hosts, sites)
+        globals.siteVersion.bump()
+        for i in range(hosts):
+            store.results.pop(BASE_ID + i, None)
+    report['summary'] = summarize(report['rounds'])
+    return report
+
+
+def runRound(app, store, stubs, modes, sites):
+    for i in range(len(stubs)):
+        store.results.pop(BASE_ID + i, None)
+    requests = sum([ stub.requests for stub in stubs ])
+    panels   = [ ]
+    start    = time.time()
+    for i in range(sites):
+        began = time.time()
+        app.get('/monitor/healthcheck/%s/bench%d'%(COUNTRY, i))
+        panels.append({ 'site': 'bench%d'%i, 'wall': time.time() - began })
+    wall      = time.time() - start
+    probes    = sum([ stub.requests for stub in stubs ]) - requests
+    latencies = [ ]
+    byMode    = { }
+    for i in range(len(stubs)):
+        result = store.get(BASE_ID + i) or { }
+        counts = byMode.setdefault(modes[i], { 'ok': 0, 'failed': 0 })
+        if result.get('status') == 1:
+            counts['ok'] += 1
+            latencies.append(result['latency'])
+        else:
+            counts['failed'] += 1
+    panelWalls = [ panel['wall'] for panel in panels ]
+    return {
+        'wall': wall,
+        'probes': probes,
+        'probesPerSec': wall and probes / wall or 0,
+        'latency': { 'p50': percentile(latencies, 0.5), 'p99': percentile(latencies, 0.99) },
+        'panel': { 'p50': percentile(panelWalls, 0.5), 'p99': percentile(panelWalls, 0.99), 'max': max(panelWalls) },
+        'modes': byMode,
+        'panels': panels,
+    }
+
+
+def summarize(rounds=None):
+    """ the median of each round's headline numbers """
+    if not rounds:
+        return { }
+    return {
+        'wall': percentile([ result['wall'] for result in rounds ], 0.5),
+        'probesPerSec': percentile([ result['probesPerSec'] for result in rounds ], 0.5),
+        'latencyP50': percentile([ result['latency']['p50'] for result in rounds if result['latency']['p50'] is not None ], 0.5),
+        'latencyP99': percentile([ result['latency']['p99'] for result in rounds if result['latency']['p99'] is not None ], 0.5),
+        'panelP99': percentile([ result['panel']['p99'] for result in rounds ], 0.5),
+    }
+
+
+def seedSites(stubs, modes, sites):
+    """ one host per stub, spread round robin over the sites """
+    from sitemonitor.model import Site, Host, meta
+    objects = [ ]
+    for i in range(sites):
+        site = Site()
+        site.id          = BASE_ID + i
+        site.name        = 'Benchmark %d'%i
+        site.endPoint    = 'bench%d'%i
+        site.countryCode = COUNTRY
+        site.createdDate = date.datetime.today()
+        objects.append(site)
+    for i in range(len(stubs)):
+        host = Host()
+        host.id     = BASE_ID + i
+        host.name   = '127.0.0.1'
+        host.ip     = '127.0.0.1'
+        host.port   = stubs[i].port
+        host.vip    = 'VIP-%s-%s'%(COUNTRY, modes[i])
+        host.status = 1
+        objects[i % sites].hosts.append(host)
+    try:
+        meta.Session.add_all(objects)
+        meta.Session.commit()
+    finally:
+        meta.Session.remove()
+
+
+def removeSites(hosts, sites):
+    from sitemonitor.model import Site, Host, meta
+    try:
+        for site in meta.Session.query(Site).filter(Site.id.between(BASE_ID, BASE_ID + sites - 1)).all():
+            site.hosts = [ ]
+            meta.Session.delete(site)
+        meta.Session.query(Host).filter(Host.id.between(BASE_ID, BASE_ID + hosts - 1)).delete(synchronize_session=False)
+        meta.Session.commit()
+    finally:
+        meta.Session.remove()
+
+
+def parseMix(mix=MIX, hosts=100):
+    """ the mode of each host from weights like fast=70,slow=30, any remainder is fast """
+    weights = [ ]
+    for part in mix.split(','):
+        mode, weight = [ value.strip() for value in part.split('=') ]
+        if mode not in MODES:
+            raise ValueError('unknown stub mode %s, expected one of %s'%(mode, ', '.join(sorted(MODES))))
+        weights.append((mode, float(weight)))
+    total = sum([ weight for mode, weight in weights ])
+    modes = [ ]
+    for mode, weight in weights:
+        modes.extend([ mode ] * int(round(hosts * weight / total)))
+    modes = modes[:hosts]
+    modes.extend([ 'fast' ] * (hosts - len(modes)))
+    return modes
+
+
+def percentile(values=None, p=0.5):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def getVersion():
+    try:
+        import pkg_resources
+        return pkg_resources.get_distribution('site-monitor').version
+    except Exception:
+        return None
+
+
+def loadApp(configFile='test.ini'):
+    """ a webtest TestApp of the application, with its tables created """
+    from paste.deploy import loadapp
+    from webtest import TestApp
+    from sitemonitor.model import meta
+    app = TestApp(loadapp('config:' + os.path.abspath(configFile)))
+    meta.metadata.create_all(bind=meta.engine)
+    return app
+
+
+if __name__ == '__main__':
+    parser = OptionParser(usage='%prog [pool|healthcheck] [options]')
+    parser.add_option('--config', default='test.ini', help='the ini file to load the application from')
+    parser.add_option('--hosts', type='int', default=100)
+    parser.add_option('--sites', type='int', default=10)
+    parser.add_option('--mix', default=MIX, help='weights of the stub modes, %s'%', '.join(sorted(MODES)))
+    parser.add_option('--rounds', type='int', default=3)
+    parser.add_option('--output', help='write the results as json to this file')
+    options, args = parser.parse_args()
+    if not args or args[0] == 'pool':
+        result = benchmarkPool()
+        print 'pool off:         %.3f ms/probe (%d connections)'%(result['fresh'] * 1000, result['connections']['fresh'])
+        print 'keep-alive pool:  %.3f ms/probe (%d connections)'%(result['pooled'] * 1000, result['connections']['pooled'])
+    else:
+        report = benchmarkHealthCheck(loadApp(options.config), options.hosts, options.sites, options.mix, options.rounds)
+        for i in range(len(report['rounds'])):
+            result = report['rounds'][i]
+            print 'round %d: %.2fs wall, %d probes, %.1f probes/s, panel p99 %.3fs'%(
+                i + 1, result['wall'], result['probes'], result['probesPerSec'], result['panel']['p99'])
+        if options.output:
+            f = open(options.output, 'w')
+            try:
+                json.dump(report, f, indent=2)
+            finally:
+                f.close()
+            print 'results written to %s'%options.output
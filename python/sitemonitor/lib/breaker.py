@@ -0,0 +1,103 @@
+"""The Circuit Breaker API
+
+Provides the Breaker class, per-host adaptive probe timeouts and a
+circuit breaker that stops probing hosts that keep failing.
+"""
+import time
+import logging
+import threading
+
+from collections import deque
+
+log = logging.getLogger(__name__)
+
+CLOSED    = 'closed'
+OPEN      = 'open'
+HALF_OPEN = 'half-open'
+
+class HostState:
+
+    def __init__(self, samples):
+        self.latencies = deque(maxlen=samples)
+        self.failures  = 0
+        self.state     = CLOSED
+        self.backoff   = 0
+        self.retryAt   = 0
+
+
+class Breaker:
+    """ adaptive timeouts and a circuit breaker, by (host, port) """
+
+    def __init__(self, minTimeout=0.25, maxTimeout=2, percentile=0.95, margin=0.25,
+                 samples=50, failures=3, backoff=5, maxBackoff=300):
+        self.minTimeout = float(minTimeout)
+        self.maxTimeout = float(maxTimeout)
+        self.percentile = float(percentile)
+        self.margin     = float(margin)
+        self.samples    = int(samples)
+        self.failures   = int(failures)
+        self.backoff    = float(backoff)
+        self.maxBackoff = float(maxBackoff)
+        self.hosts      = { }
+        self.lock       = threading.Lock()
+
+    def getState(self, key):
+        self.lock.acquire()
+        try:
+            state = self.hosts.get(key)
+            if not state:
+                state = self.hosts[key] = HostState(self.samples)
+            return state
+        finally:
+            self.lock.release()
+
+    def getTimeout(self, key):
+        """ the percentile of the observed latencies plus the margin, clamped to min/max """
+        latencies = sorted(self.getState(key).latencies)
+        if len(latencies) < 5:
+            return self.maxTimeout
+        index   = min(len(latencies) - 1, int(len(latencies) * self.percentile))
+        timeout = latencies[index] + self.margin
+        return min(self.maxTimeout, max(self.minTimeout, timeout))
+
+    def allow(self, key):
+        """ whether the host may be probed now, an open circuit lets one trial probe through once its backoff expires """
+        state = self.getState(key)
+        self.lock.acquire()
+        try:
+            if state.state == CLOSED:
+                return True
+            if state.state == OPEN and time.time() >= state.retryAt:
+                state.state = HALF_OPEN
+                return True
+            return False
+        finally:
+            self.lock.release()
+
+    def success(self, key, latency=None):
+        state = self.getState(key)
+        self.lock.acquire()
+        try:
+            if state.state != CLOSED:
+                log.info("Circuit closed for %s:%s"%key)
+            if latency is not None:
+                state.latencies.append(latency)
+            state.failures = 0
+            state.backoff  = 0
+            state.state    = CLOSED
+        finally:
+            self.lock.release()
+
+    def failure(self, key):
+        state = self.getState(key)
+        self.lock.acquire()
+        try:
+            state.failures += 1
+            if state.state == HALF_OPEN or state.failures >= self.failures:
+                state.backoff = min(self.maxBackoff, state.backoff * 2 or self.backoff)
+                state.retryAt = time.time() + state.backoff
+                if state.state != OPEN:
+                    log.warning("Circuit open for %s:%s, retry in %ss"%(key + (state.backoff,)))
+                state.state = OPEN
+        finally:
+            self.lock.release()
@@ -0,0 +1,137 @@
+"""The Cache API
+
+Provides the Version class, a counter bumped on every change to the
+data it guards so responses built from that data can be validated
+with an ETag instead of being rebuilt, the Preferences class, which
+keeps each site's decoded preferences until the site saves new ones
+or they are maxAge seconds old,
+and the SiteRegistry class, which resolves sites without a query.
+"""
+import time
+import threading
+
+class Version:
+    """ thread safe change counter, starts at the load time so ETags do not survive a restart """
+
+    def __init__(self, start=None):
+        if start is None:
+            start = int(time.time())
+        self.value = int(start)
+        self.lock  = threading.Lock()
+
+    def get(self):
+        return self.value
+
+    def bump(self):
+        self.lock.acquire()
+        try:
+            self.value += 1
+            return self.value
+        finally:
+            self.lock.release()
+
+
+class Preferences:
+    """ the decoded preferences of each site, loader reads and decodes them the first time a
+        site is asked for and again once they are older than maxAge, so a save made by another
+        process still shows up, misses are kept too, invalidate drops a site after it saves new ones
+    """
+
+    def __init__(self, loader=None, maxAge=300):
+        self.loader      = loader
+        self.maxAge      = float(maxAge)
+        self.entries     = { }
+        self.generations = { }
+        self.lock        = threading.Lock()
+        self.hits        = 0
+        self.loads       = 0
+
+    def get(self, siteId):
+        siteId = int(siteId)
+        self.lock.acquire()
+        try:
+            entry = self.entries.get(siteId)
+            if entry and time.time() - entry[1] <= self.maxAge:
+                self.hits += 1
+                return entry[0]
+            generation = self.generations.get(siteId, 0)
+        finally:
+            self.lock.release()
+        data = self.loader(siteId)
+        self.lock.acquire()
+        try:
+            self.loads += 1
+            if self.generations.get(siteId, 0) == generation:
+                """ not invalidated while it was loading """
+                self.entries[siteId] = (data, time.time())
+        finally:
+            self.lock.release()
+        return data
+
+    def invalidate(self, siteId):
+        siteId = int(siteId)
+        self.lock.acquire()
+        try:
+            self.entries.pop(siteId, None)
+            self.generations[siteId] = self.generations.get(siteId, 0) + 1
+        finally:
+            self.lock.release()
+
+    def getMetrics(self):
+        return { 'hits': self.hits, 'loads': self.loads, 'sites': len(self.entries) }
+
+
+class SiteRegistry:
+    """ resolves (countryCode, endPoint) to an immutable snapshot of the site, loader returns the
+        snapshots of every site keyed that way and is called again once version moves on or the
+        snapshots are older than maxAge, so edits made by another process still show up,
+        the generation moves on with every load that finds the snapshots changed
+    """
+
+    def __init__(self, loader=None, version=None, maxAge=300):
+        self.loader     = loader
+        self.version    = version or Version()
+        self.maxAge     = float(maxAge)
+        self.sites      = { }
+        self.loaded     = None
+        self.loadedAt   = 0
+        self.lock       = threading.Lock()
+        self.loads      = 0
+        self.generation = 0
+
+    def get(self, country=None, endPoint=None):
+        """ the snapshot of a site, None if there is no such site """
+        return self.getSites().get((country, endPoint))
+
+    def getAll(self):
+        """ every snapshot, ordered by site id """
+        return sorted(self.getSites().values(), key=lambda site: site.id)
+
+    def getCount(self):
+        """ the number of sites, as of the last load """
+        return len(self.getSites())
+
+    def getVersion(self):
+        """ the ETag version of anything built from the snapshots, reloads them first when they are stale """
+        self.getSites()
+        return '%s.%d'%(self.loaded, self.generation)
+
+    def getSites(self):
+        if self._isStale():
+            self.lock.acquire()
+            try:
+                if self._isStale():
+                    version = self.version.get()
+                    sites   = self.loader()
+                    if sites != self.sites:
+                        self.generation += 1
+                    self.sites    = sites
+                    self.loaded   = version
+                    self.loadedAt = time.time()
+                    self.loads   += 1
+            finally:
+                self.lock.release()
+        return self.sites
+
+    def _isStale(self):
+        return self.loaded != self.version.get() or time.time() - self.loadedAt > self.maxAge
@@ -0,0 +1,108 @@
+"""The VIP Catalog API
+
+Provides the VipCatalog class, an in-process index of the hosts behind
+each VIP with their member and healthy counts, synced from the host rows
+the scheduler loads every cycle and kept healthy from the status store.
+"""
+import time
+import logging
+import threading
+
+from collections import namedtuple
+
+log = logging.getLogger(__name__)
+
+VipMember = namedtuple('VipMember', 'id name ip port status')
+
+class VipCatalog:
+    """ the members of each VIP, sync replaces them from (id, name, ip, port, vip, status) host rows,
+        loader is called for the rows when there has been no sync for maxAge seconds or version has
+        moved on, setStatus counts the members whose latest result is OK
+    """
+
+    def __init__(self, loader=None, version=None, maxAge=60):
+        self.loader   = loader
+        self.version  = version
+        self.maxAge   = float(maxAge)
+        self.members  = { }
+        self.vips     = { }
+        self.statuses = { }
+        self.healthy  = { }
+        self.synced   = None
+        self.syncedAt = 0
+        self.lock     = threading.Lock()
+        self.loading  = threading.Lock()
+
+    def sync(self, hosts=None, version=None):
+        """ rebuild the VIPs from the host rows, a host referenced by several sites is one member """
+        if version is None:
+            version = self._getVersion()
+        members = { }
+        vips    = { }
+        for host in hosts or [ ]:
+            vip = getattr(host, 'vip', None)
+            if not vip or vips.has_key(host.id):
+                continue
+            vips[host.id] = vip
+            members.setdefault(vip, [ ]).append(VipMember(host.id, host.name, host.ip, host.port, getattr(host, 'status', None)))
+        self.lock.acquire()
+        try:
+            self.members  = dict([ (vip, tuple(sorted(rows))) for vip, rows in members.items() ])
+            self.vips     = vips
+            self.healthy  = { }
+            for id, vip in vips.items():
+                if self.statuses.get(id) == 1:
+                    self.healthy[vip] = self.healthy.get(vip, 0) + 1
+            self.synced   = version
+            self.syncedAt = time.time()
+        finally:
+            self.lock.release()
+
+    def setStatus(self, results=None):
+        """ a hash of health check results by host id, keeps each VIP's healthy count current """
+        self.lock.acquire()
+        try:
+            for id, result in (results or { }).items():
+                status   = result['status']
+                previous = self.statuses.get(id)
+                self.statuses[id] = status
+                vip = self.vips.get(id)
+                if not vip or (previous == 1) == (status == 1):
+                    continue
+                self.healthy[vip] = self.healthy.get(vip, 0) + (status == 1 and 1 or -1)
+        finally:
+            self.lock.release()
+
+    def getVips(self):
+        """ the VIP names, sorted """
+        self._refresh()
+        return sorted(self.members.keys())
+
+    def getMembers(self, vip=None):
+        """ a VipMember for each host behind the VIP, ordered by id """
+        self._refresh()
+        return self.members.get(vip, ( ))
+
+    def getCounts(self, vip=None):
+        self._refresh()
+        return { 'members': len(self.members.get(vip, ( ))), 'healthy': self.healthy.get(vip, 0) }
+
+    def _getVersion(self):
+        return self.version and self.version.get()
+
+    def _isStale(self):
+        return self.synced != self._getVersion() or time.time() - self.syncedAt > self.maxAge
+
+    def _refresh(self):
+        """ load the rows when the scheduler has not synced them lately """
+        if not self.loader or not self._isStale():
+            return
+        self.loading.acquire()
+        try:
+            if self._isStale():
+                version = self._getVersion()
+                self.sync(self.loader(), version)
+        except Exception, e:
+            log.error("VIP catalog failed to load hosts: %s"%e)
+        finally:
+            self.loading.release()
@@ -0,0 +1,185 @@
+"""The Connection Pool API
+
+Provides the ConnectionPool class, keep-alive HTTP connections keyed by
+(host, port) for the health check client.
+"""
+import time
+import errno
+import socket
+import httplib
+import logging
+import threading
+
+from sitemonitor.lib.resolver import RESOLVER
+
+log = logging.getLogger(__name__)
+
+# what a server that closed an idle keep-alive socket leaves a request with
+CLOSED = (errno.ECONNRESET, errno.EPIPE, errno.ECONNABORTED)
+
+class PoolTimeout(Exception):
+    pass
+
+
+class PooledResponse:
+    """ wraps an httplib response, release() hands the connection back to the pool """
+
+    def __init__(self, pool, key, conn, response):
+        self.pool     = pool
+        self.key      = key
+        self.conn     = conn
+        self.response = response
+        self.status   = response.status
+
+    def read(self, amt=None):
+        return self.response.read(amt)
+
+    def getheader(self, name, default=None):
+        return self.response.getheader(name, default)
+
+    def release(self):
+        if not self.conn:
+            return
+        """ only a fully read response leaves the socket in a reusable state """
+        if self.response.isclosed() and not self.response.will_close:
+            self.pool.put(self.key, self.conn)
+        else:
+            self.pool.discard(self.key, self.conn)
+        self.conn = None
+
+    close = release
+
+
+class ResolvedConnection(httplib.HTTPConnection):
+    """ connects to the address the resolver has cached for the host, the Host header keeps the name """
+
+    def __init__(self, host, port=None, timeout=None, resolver=None):
+        httplib.HTTPConnection.__init__(self, host, port, timeout=timeout)
+        self.resolver = resolver
+
+    def connect(self):
+        self.sock = socket.create_connection((self.resolver.resolve(self.host), self.port), self.timeout)
+
+
+class ConnectionPool:
+    """ keep-alive connections by (host, port), capped per host with idle eviction """
+
+    def __init__(self, maxPerHost=4, maxIdle=60, wait=5, resolver=None):
+        self.maxPerHost  = int(maxPerHost)
+        self.maxIdle     = float(maxIdle)
+        self.wait        = float(wait)
+        self.resolver    = resolver or RESOLVER
+        self.idle        = { }
+        self.active      = { }
+        self.connects    = 0
+        self.reconnects  = 0
+        self.swept       = time.time()
+        self.lock        = threading.Condition()
+
+    def get(self, key, timeout=None):
+        """ returns an (connection, reused) tuple, waits while the host is at its cap """
+        expires = time.time() + self.wait
+        self.lock.acquire()
+        try:
+            while True:
+                self._sweep()
+                self._evict(key)
+                idle = self.idle.get(key)
+                if idle:
+                    conn, used = idle.pop()
+                    self.active[key] = self.active.get(key, 0) + 1
+                    conn.timeout = timeout
+                    if conn.sock:
+                        conn.sock.settimeout(timeout)
+                    return conn, True
+                if self.active.get(key, 0) < self.maxPerHost:
+                    self.active[key] = self.active.get(key, 0) + 1
+                    self.connects += 1
+                    break
+                remaining = expires - time.time()
+                if remaining <= 0:
+                    raise PoolTimeout('no free connection for %s:%s'%key)
+                self.lock.wait(remaining)
+        finally:
+            self.lock.release()
+        return ResolvedConnection(key[0], key[1], timeout, self.resolver), False
+
+    def put(self, key, conn):
+        self.lock.acquire()
+        try:
+            self.active[key] -= 1
+            self.idle.setdefault(key, [ ]).append((conn, time.time()))
+            self.lock.notify()
+        finally:
+            self.lock.release()
+
+    def discard(self, key, conn):
+        conn.close()
+        self.lock.acquire()
+        try:
+            self.active[key] -= 1
+            self.lock.notify()
+        finally:
+            self.lock.release()
+
+    def urlopen(self, host, port, path='/', timeout=None):
+        """ GET the path on a pooled connection, reconnects once if the server closed a reused socket,
+            never after a timeout, a slow host would otherwise take twice its timeout
+        """
+        key = (host, int(port))
+        conn, reused = self.get(key, timeout)
+        try:
+            try:
+                conn.request('GET', path)
+                response = conn.getresponse()
+            except (httplib.BadStatusLine, socket.error), e:
+                if not reused or not isClosed(e):
+                    raise
+                log.debug("Reconnecting to %s:%s: %s"%(host, port, e))
+                conn.close()
+                self.reconnects += 1
+                conn.request('GET', path)
+                response = conn.getresponse()
+        except:
+            self.discard(key, conn)
+            raise
+        return PooledResponse(self, key, conn, response)
+
+    def clear(self):
+        self.lock.acquire()
+        try:
+            for key, idle in self.idle.items():
+                for conn, used in idle:
+                    conn.close()
+            self.idle = { }
+        finally:
+            self.lock.release()
+
+    def _sweep(self):
+        """ every maxIdle seconds evict the idle connections of every host """
+        if time.time() - self.swept < self.maxIdle:
+            return
+        self.swept = time.time()
+        for key in self.idle.keys():
+            self._evict(key)
+
+    def _evict(self, key):
+        """ close idle connections that have not been used for maxIdle seconds """
+        idle = self.idle.get(key)
+        if not idle:
+            return
+        oldest = time.time() - self.maxIdle
+        fresh  = [ ]
+        for conn, used in idle:
+            if used < oldest:
+                conn.close()
+            else:
+                fresh.append((conn, used))
+        self.idle[key] = fresh
+
+
+def isClosed(e):
+    """ whether the request failed on a socket the server had closed """
+    if isinstance(e, httplib.BadStatusLine):
+        return True
+    return not isinstance(e, socket.timeout) and getattr(e, 'errno', None) in CLOSED
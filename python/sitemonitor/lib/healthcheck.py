@@ -0,0 +1,506 @@
+"""The Health Check API
+
+Provides the HealthCheck class for probing a set of hosts concurrently and
+the Matcher class for scanning health check responses.
+"""
+import time
+import logging
+import threading
+import re as regexp
+
+from Queue import Queue, Empty
+from collections import deque
+
+from sitemonitor.lib.breaker import Breaker
+from sitemonitor.lib.connectionpool import ConnectionPool
+from sitemonitor.lib.histogram import Histogram
+
+log     = logging.getLogger(__name__)
+PATH    = '/health-check'
+TOKEN   = 'SCALL-OK'
+POOL    = ConnectionPool()
+TIMEOUT = 2
+
+class Matcher:
+    """ reads a response in chunks until the precompiled pattern matches or the byte budget runs out """
+
+    def __init__(self, pattern=TOKEN, maxBytes=65536, chunkSize=4096, overlap=256, name=None):
+        self.name      = name or pattern
+        self.pattern   = regexp.compile(pattern)
+        self.maxBytes  = int(maxBytes)
+        self.chunkSize = int(chunkSize)
+        self.overlap   = int(overlap)
+
+    def match(self, f):
+        """ returns a (matched at byte offset or None, bytes read) tuple """
+        window = ''
+        offset = 0
+        read   = 0
+        while read < self.maxBytes:
+            chunk = f.read(min(self.chunkSize, self.maxBytes - read))
+            if not chunk:
+                break
+            read   += len(chunk)
+            window += chunk
+            match   = self.pattern.search(window)
+            if match:
+                return offset + match.start(), read
+            """ keep the tail so a match spanning two chunks is still found """
+            if len(window) > self.overlap:
+                offset += len(window) - self.overlap
+                window  = window[-self.overlap:]
+        return None, read
+
+
+MATCHER = Matcher(name='healthcheck')
+
+def newResult(host=None, port=None, error=None):
+    """ the result hash of a host that has not answered """
+    return {
+        'host': host,
+        'port': port,
+        'status': 0,
+        'latency': None,
+        'checked': time.time(),
+        'response': None,
+        'error': error,
+        'matchedAt': None,
+        'bytesRead': 0,
+        'bytesTotal': None,
+    }
+
+def probe(host=None, port=None, pool=None, timeout=TIMEOUT, matcher=None):
+    """ probe a single host over a pooled keep-alive connection, returns a result hash """
+    if not pool:
+        pool = POOL
+    if not matcher:
+        matcher = MATCHER
+    result = newResult(host, port)
+    start  = time.time()
+    try:
+        f = pool.urlopen(host, port, PATH, timeout)
+        result['response'] = f.status
+        try:
+            if f.status != 200:
+                result['error'] = 'HTTP %s'%f.status
+            else:
+                length = f.getheader('content-length')
+                if length and length.isdigit():
+                    result['bytesTotal'] = int(length)
+                result['matchedAt'], result['bytesRead'] = matcher.match(f)
+                if result['matchedAt'] is not None:
+                    result['status'] = 1
+        finally:
+            f.release()
+    except Exception, e:
+        log.error("%s:%s%s: %s"%(host, port, PATH, e))
+        result['error'] = str(e) or e.__class__.__name__
+    result['latency'] = time.time() - start
+    return result
+
+
+class ProbePlan:
+    """ collapses the host references of every site into one probe per (name, port) """
+
+    def __init__(self, hosts=None):
+        self.targets    = { }
+        self.vips       = { }
+        self.addresses  = { }
+        self.sites      = { }
+        self.hostSites  = { }
+        self.references = 0
+        for host in hosts or [ ]:
+            self.references += 1
+            target = (host.name, int(host.port))
+            ids    = self.targets.setdefault(target, [ ])
+            if host.id not in ids:
+                ids.append(host.id)
+            if getattr(host, 'vip', None):
+                self.vips[target] = host.vip
+            if getattr(host, 'ip', None):
+                self.addresses[host.name] = host.ip
+            siteId = getattr(host, 'siteId', None)
+            if siteId:
+                self.sites.setdefault(siteId, [ ]).append(host.id)
+                self.hostSites.setdefault(host.id, [ ]).append(siteId)
+
+    def getProbes(self):
+        return len(self.targets)
+
+    def getSaved(self):
+        """ the number of probes deduplication saved """
+        return self.references - len(self.targets)
+
+    def getSites(self, ids=None):
+        """ the host ids of every site referencing any of the ids """
+        sites = { }
+        for id in ids or [ ]:
+            for siteId in self.hostSites.get(id, [ ]):
+                sites[siteId] = self.sites[siteId]
+        return sites
+
+    def fanOut(self, results=None):
+        """ turns a hash of results by (name, port) into a hash by host id """
+        byId = { }
+        for target, result in (results or { }).items():
+            for id in self.targets.get(target, [ ]):
+                byId[id] = result
+        return byId
+
+
+class HealthCheck:
+    """ runs the health checks for a set of hosts on a bounded pool of threads """
+
+    def __init__(self, threads=10, deadline=5, pool=None, breaker=None, matcher=None, pacer=None):
+        self.threads  = int(threads)
+        self.deadline = float(deadline)
+        self.pool     = pool or POOL
+        self.breaker  = breaker or Breaker()
+        self.matcher  = matcher or MATCHER
+        self.pacer    = pacer
+
+    def checkHosts(self, hosts=None, matcher=None):
+        """ probe all of the hosts in parallel, returns a hash of results by host id """
+        if not hosts:
+            return { }
+        results = self.checkPlan(ProbePlan(hosts), matcher)
+        for host in hosts:
+            if results.has_key(host.id):
+                host.healthCheck = results[host.id]['status']
+        return results
+
+    def checkPlan(self, plan=None, matcher=None, callback=None):
+        """ probe each unique target of a ProbePlan once, returns a hash of results by host id,
+            the callback gets the results for each target's host ids as soon as it is probed,
+            with a pacer the targets are fed to the threads as it releases them, a target whose
+            probe had not started by the deadline has no result, so its last one stands
+        """
+        results = { }
+        if not plan or not plan.targets:
+            return results
+        self.pool.resolver.setFallbacks(plan.addresses)
+        targets = plan.targets.keys()
+        jobs    = Queue()
+        done    = Queue()
+        stop    = threading.Event()
+        started = set()
+        threads = min(self.threads, len(targets))
+        for i in range(threads):
+            thread = threading.Thread(target=self._worker, args=(jobs, done, stop, matcher or self.matcher, started))
+            thread.setDaemon(True)
+            thread.start()
+        feeder = threading.Thread(target=self._feeder, args=(targets, plan.vips, jobs, stop, threads))
+        feeder.setDaemon(True)
+        feeder.start()
+        expires = time.time() + self.deadline
+        while len(results) < len(targets):
+            remaining = expires - time.time()
+            if remaining <= 0:
+                break
+            try:
+                target, result = done.get(True, remaining)
+            except Empty:
+                break
+            results[target] = result
+            if callback:
+                callback(plan.fanOut({ target: result }))
+        stop.set()
+        feeder.join(1)
+        """ a probe still outstanding missed the deadline, a target never probed was dropped """
+        skipped = 0
+        for name, port in targets:
+            if results.has_key((name, port)):
+                continue
+            if (name, port) not in started:
+                skipped += 1
+                continue
+            log.warning("Health Check deadline exceeded for %s:%s"%(name, port))
+            results[(name, port)] = newResult(name, port, 'deadline exceeded')
+        if skipped:
+            log.warning("Health Check skipped %d of %d hosts that were not probed by the deadline"%(skipped, len(targets)))
+        return plan.fanOut(results)
+
+    def _feeder(self, targets, vips, jobs, stop, threads):
+        try:
+            if self.pacer:
+                self.pacer.run(targets, vips, jobs.put, stop)
+            else:
+                for target in targets:
+                    jobs.put(target)
+        finally:
+            """ one None for each thread to stop on """
+            for i in range(threads):
+                jobs.put(None)
+
+    def _worker(self, jobs, done, stop, matcher, started):
+        while not stop.isSet():
+            target = jobs.get()
+            if not target or stop.isSet():
+                return
+            started.add(target)
+            done.put((target, self.check(target[0], target[1], matcher)))
+
+    def getPacing(self):
+        """ the pacer's queue depth and lag for the last cycle """
+        return self.pacer and self.pacer.getMetrics() or { }
+
+    def check(self, name, port, matcher=None):
+        """ probe a host with its adaptive timeout, unless its circuit is open """
+        key = (name, port)
+        if not self.breaker.allow(key):
+            return newResult(name, port, 'circuit open')
+        result = probe(name, port, self.pool, self.breaker.getTimeout(key), matcher or self.matcher)
+        if result['response'] is None:
+            self.breaker.failure(key)
+        else:
+            self.breaker.success(key, result['latency'])
+        return result
+
+
+class StatusStore:
+    """ thread safe store of the latest health check result for each host, a latency histogram
+        for each host, and a log of the host and site status transitions for the dashboards to follow
+    """
+
+    def __init__(self, healthcheck=None, maxAge=60, maxEvents=1000):
+        self.healthcheck = healthcheck
+        self.maxAge      = float(maxAge)
+        self.results     = { }
+        self.histograms  = { }
+        self.metrics     = { }
+        self.sites       = { }
+        self.events      = deque(maxlen=maxEvents)
+        self.sequence    = 0
+        self.version     = 0
+        self.changed     = { }
+        self.measured    = 0
+        self.listeners   = [ ]
+        self.lock        = threading.Condition()
+
+    def get(self, id=None):
+        self.lock.acquire()
+        try:
+            return self.results.get(id)
+        finally:
+            self.lock.release()
+
+    def getMany(self, ids=None):
+        """ returns a hash of the fresh results by host id, stale or missing ids are left out """
+        result = { }
+        if not ids:
+            return result
+        oldest = time.time() - self.maxAge
+        self.lock.acquire()
+        try:
+            for id in ids:
+                found = self.results.get(id)
+                if found and found['checked'] >= oldest:
+                    result[id] = found
+        finally:
+            self.lock.release()
+        return result
+
+    def update(self, results=None):
+        if not results:
+            return
+        self.lock.acquire()
+        try:
+            self.version += 1
+            for id, result in results.items():
+                previous = self.results.get(id)
+                if result is not previous and result.get('response') is not None and result.get('latency') is not None:
+                    self.histograms.setdefault(id, Histogram()).add(result['latency'])
+                if not previous or previous['status'] != result['status']:
+                    self._addEvent({
+                        'type': 'host',
+                        'id': id,
+                        'status': result['status'],
+                        'latency': result.get('latency'),
+                        'error': result.get('error'),
+                    })
+                self.results[id] = result
+                self.changed[id] = self.version
+            self._notify()
+        finally:
+            self.lock.release()
+        for listener in self.listeners:
+            listener(results)
+
+    def addListener(self, listener):
+        """ listener is called with every batch of results after it is stored """
+        self.listeners.append(listener)
+
+    def updateSites(self, sites=None):
+        """ count the OK hosts of each site's health check, a hash of host ids by site id """
+        if not sites:
+            return
+        self.lock.acquire()
+        try:
+            for siteId, ids in sites.items():
+                ok = 0
+                for id in ids:
+                    if self.results.has_key(id) and self.results[id]['status'] == 1:
+                        ok += 1
+                state = (ok, len(ids))
+                if self.sites.get(siteId) != state:
+                    self.sites[siteId] = state
+                    self._addEvent({ 'type': 'site', 'id': siteId, 'ok': ok, 'total': len(ids) })
+            self._notify()
+        finally:
+            self.lock.release()
+
+    def getHistogram(self, id=None):
+        """ a copy of the host's latency histogram, to merge or serialize """
+        self.lock.acquire()
+        try:
+            return Histogram().merge(self.histograms.get(id))
+        finally:
+            self.lock.release()
+
+    def getLatency(self, id=None):
+        """ the p50, p95 and p99 of every probe of the host that got a response """
+        histogram = self.getHistogram(id)
+        if not histogram.total:
+            return None
+        return {
+            'count': histogram.total,
+            'p50': histogram.percentile(0.5),
+            'p95': histogram.percentile(0.95),
+            'p99': histogram.percentile(0.99),
+        }
+
+    def getSequence(self):
+        return self.sequence
+
+    def getVersion(self, ids=None, metrics=False):
+        """ the ETag version of what is built from the results of the ids, changes when one of them
+            is stored or goes stale, and with metrics whenever the scheduler's metrics do, results
+            of other hosts leave it alone
+        """
+        fresh = len(self.getMany(ids))
+        self.lock.acquire()
+        try:
+            changed = max([ self.changed.get(id, 0) for id in ids or [ ] ] or [ 0 ])
+            if metrics:
+                return '%d.%d.%d'%(changed, fresh, self.measured)
+            return '%d.%d'%(changed, fresh)
+        finally:
+            self.lock.release()
+
+    def waitEvents(self, since=0, timeout=30):
+        """ the events after the since sequence, waits up to timeout seconds for one to happen,
+            a reset event means the log no longer reaches back to since, or since is from before
+            a restart and is ahead of the log
+        """
+        expires = time.time() + timeout
+        self.lock.acquire()
+        try:
+            if since > self.sequence:
+                return [ { 'type': 'reset', 'seq': self.sequence } ]
+            while self.sequence <= since:
+                remaining = expires - time.time()
+                if remaining <= 0:
+                    return [ ]
+                self.lock.wait(remaining)
+            if since and self.events and self.events[0]['seq'] > since + 1:
+                return [ { 'type': 'reset', 'seq': self.sequence } ]
+            return [ event for event in self.events if event['seq'] > since ]
+        finally:
+            self.lock.release()
+
+    def _addEvent(self, event):
+        self.sequence += 1
+        event['seq']   = self.sequence
+        self.events.append(event)
+
+    def _notify(self):
+        self.lock.notifyAll()
+
+    def setMetrics(self, **metrics):
+        self.lock.acquire()
+        try:
+            self.measured += 1
+            self.metrics.update(metrics)
+        finally:
+            self.lock.release()
+
+    def getMetrics(self):
+        self.lock.acquire()
+        try:
+            return dict(self.metrics)
+        finally:
+            self.lock.release()
+
+    def checkHosts(self, hosts=None):
+        """ same as HealthCheck.checkHosts, but only probes hosts missing from the store, and only
+            with a healthcheck, without one they are left unknown until the scheduler fills them in
+        """
+        if not hosts:
+            return { }
+        results = self.getMany([ host.id for host in hosts ])
+        missing = [ host for host in hosts if not results.has_key(host.id) ]
+        if missing and self.healthcheck:
+            probed = self.healthcheck.checkHosts(missing)
+            self.update(probed)
+            results.update(probed)
+        for host in hosts:
+            if results.has_key(host.id):
+                host.healthCheck = results[host.id]['status']
+        return results
+
+
+class Scheduler(threading.Thread):
+    """ probes every host on an interval and writes the results to the store,
+    the loader returns one (id, name, port) row per site reference to a host,
+    and the rows are synced to the catalog when there is one
+    """
+
+    def __init__(self, healthcheck, store, loader, interval=30, recorder=None, catalog=None):
+        threading.Thread.__init__(self, name='healthcheck-scheduler')
+        self.setDaemon(True)
+        self.healthcheck = healthcheck
+        self.store       = store
+        self.loader      = loader
+        self.recorder    = recorder
+        self.catalog     = catalog
+        self.interval    = float(interval)
+        self.stopped     = threading.Event()
+
+    def run(self):
+        log.info("Health Check scheduler started, interval: %ss"%self.interval)
+        while not self.stopped.isSet():
+            start = time.time()
+            self.runOnce()
+            self.stopped.wait(max(0, self.interval - (time.time() - start)))
+
+    def runOnce(self):
+        try:
+            hosts = self.loader()
+        except Exception, e:
+            log.error("Health Check scheduler failed to load hosts: %s"%e)
+            return
+        if self.catalog:
+            self.catalog.sync(hosts)
+        plan    = ProbePlan(hosts)
+        def publish(results):
+            self.store.update(results)
+            self.store.updateSites(plan.getSites(results.keys()))
+        results = self.healthcheck.checkPlan(plan, callback=publish)
+        self.store.update(results)
+        self.store.updateSites(plan.sites)
+        self.store.setMetrics(
+            references=plan.references,
+            probes=plan.getProbes(),
+            saved=plan.getSaved(),
+            pacing=self.healthcheck.getPacing(),
+            checked=time.time())
+        log.info("Health Check cycle: %d probes for %d references, %d saved by deduplication"%(
+            plan.getProbes(), plan.references, plan.getSaved()))
+        if self.recorder:
+            try:
+                self.recorder(results)
+            except Exception, e:
+                log.error("Health Check scheduler failed to record results: %s"%e)
+
+    def stop(self):
+        self.stopped.set()
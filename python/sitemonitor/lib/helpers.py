@@ -5,6 +5,7 @@ available to Controllers. This module is available to templates as 'h'.
 """
 # Import helpers as desired, or define your own, ie:
 #from webhelpers.html.tags import checkbox, password
+import time
 import datetime as date
 
 from pylons import url
@@ -62,3 +63,23 @@ def hasSelected(site=None, selected=None):
     if site and selected:
         return site.getEndPoint() == selected.getEndPoint() and 'selected' or None
     return None
+
+def healthTitle(result=None):
+    if not result:
+        return None
+    title = 'checked %s'%time.strftime('%H:%M:%S', time.localtime(result['checked']))
+    if result['latency'] is not None:
+        title += ', %d ms'%(result['latency'] * 1000)
+    if result['bytesRead']:
+        title += ', read %d bytes'%result['bytesRead']
+        if result['bytesTotal']:
+            title += ' of %d'%result['bytesTotal']
+    if result['error']:
+        title += ', %s'%result['error']
+    return title
+
+
+def latencySummary(latency=None):
+    if not latency:
+        return None
+    return 'p50 %d / p95 %d / p99 %d ms'%(latency['p50'] * 1000, latency['p95'] * 1000, latency['p99'] * 1000)
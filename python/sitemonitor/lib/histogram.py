@@ -0,0 +1,66 @@
+"""The Histogram API
+
+Provides the Histogram class, a fixed memory log-bucketed latency
+histogram that can be merged and serialized.
+"""
+import math
+import simplejson as json
+
+BASE    = 0.0001
+GROWTH  = 1.1
+BUCKETS = 160
+
+class Histogram:
+    """ latency counts in buckets growing by 10%, from 0.1ms to over a minute """
+
+    def __init__(self, counts=None):
+        self.counts = { }
+        self.total  = 0
+        if counts:
+            self.merge(counts)
+
+    def bucket(self, value):
+        if value <= BASE:
+            return 0
+        return min(BUCKETS - 1, int(math.log(value / BASE) / math.log(GROWTH)) + 1)
+
+    def add(self, value=None, count=1):
+        if value is None:
+            return
+        index = self.bucket(value)
+        self.counts[index] = self.counts.get(index, 0) + count
+        self.total += count
+
+    def merge(self, other=None):
+        """ adds the counts of another Histogram or of a hash of counts by bucket """
+        if not other:
+            return self
+        if isinstance(other, Histogram):
+            other = other.counts
+        for index, count in other.items():
+            index = int(index)
+            self.counts[index] = self.counts.get(index, 0) + count
+            self.total += count
+        return self
+
+    def percentile(self, p=0.5):
+        """ the upper bound of the bucket holding the p-th percentile """
+        if not self.total:
+            return None
+        rank = max(1, int(math.ceil(self.total * p)))
+        seen = 0
+        for index in sorted(self.counts.keys()):
+            seen += self.counts[index]
+            if seen >= rank:
+                return BASE * GROWTH ** index
+        return BASE * GROWTH ** max(self.counts.keys())
+
+    def toString(self):
+        return json.dumps(self.counts)
+
+    def fromString(self, string=None):
+        self.counts = { }
+        self.total  = 0
+        if string:
+            self.merge(json.loads(string))
+        return self
@@ -0,0 +1,120 @@
+"""The Probe Pacer API
+
+Provides the Pacer class, which spreads a cycle of probes across the
+interval with a deterministic per host jitter and holds them to a
+probes/sec budget per VIP and overall, and the TokenBucket it uses.
+"""
+import time
+import zlib
+import logging
+
+from collections import deque
+
+log = logging.getLogger(__name__)
+
+class TokenBucket:
+    """ rate tokens a second, up to burst of them saved up, a rate of 0 is unlimited """
+
+    def __init__(self, rate=0, burst=1):
+        self.rate    = float(rate)
+        self.burst   = max(1.0, float(burst))
+        self.tokens  = self.burst
+        self.updated = time.time()
+
+    def getDelay(self, now=None):
+        """ the seconds until a token is free """
+        if not self.rate:
+            return 0
+        now = now or time.time()
+        self.tokens  = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        if self.rate:
+            self.tokens -= 1
+
+
+class Pacer:
+    """ releases the targets of a cycle at their jittered offset into the interval, once both
+        the global and their VIP's token bucket allow it, and keeps the depth and lag of the
+        targets waiting on the budget, a target whose VIP is out of tokens lets the due targets
+        of other VIPs go first
+    """
+
+    def __init__(self, interval=30, spread=0.8, rate=0, vipRate=0):
+        self.interval = float(interval)
+        self.spread   = float(spread)
+        self.rate     = float(rate)
+        self.vipRate  = float(vipRate)
+        self.metrics  = { }
+
+    def getOffset(self, target):
+        """ the same fraction of the spread every cycle, so each host is probed once an interval """
+        return (zlib.crc32('%s:%d'%target) & 0xffffffff) / 4294967296.0 * self.interval * self.spread
+
+    def schedule(self, targets=None):
+        """ the targets ordered by their offset into the cycle """
+        return sorted([ (self.getOffset(target), target) for target in targets or [ ] ])
+
+    def run(self, targets=None, vips=None, release=None, stop=None):
+        """ calls release with each target when it is due and within budget, until stop is set,
+            the due targets wait in a queue per VIP so one VIP over its budget holds back only its own
+        """
+        vips     = vips or { }
+        overall  = TokenBucket(self.rate)
+        buckets  = { }
+        schedule = deque(self.schedule(targets))
+        total    = len(schedule)
+        queues   = { }
+        start    = time.time()
+        depth    = 0
+        lags     = [ ]
+        released = 0
+        while (schedule or queues) and not stop.isSet():
+            now = time.time()
+            while schedule and start + schedule[0][0] <= now:
+                offset, target = schedule.popleft()
+                queues.setdefault(vips.get(target), deque()).append((offset, target))
+            """ the earliest head of a queue whose VIP has a token, or how long until one is due or has one """
+            ready = None
+            wait  = schedule and start + schedule[0][0] - now or self.interval
+            for vip, queue in queues.items():
+                delay = vip and buckets.setdefault(vip, TokenBucket(self.vipRate)).getDelay(now) or 0
+                if delay:
+                    wait = min(wait, delay)
+                elif not ready or queue[0] < ready[1]:
+                    ready = (vip, queue[0])
+            if ready:
+                wait = overall.getDelay(now)
+            if not ready or wait:
+                stop.wait(wait)
+                continue
+            vip, (offset, target) = ready
+            queues[vip].popleft()
+            if not queues[vip]:
+                del queues[vip]
+            overall.take()
+            if vip:
+                buckets[vip].take()
+            lags.append(now - start - offset)
+            """ the targets already due behind this one are waiting on the budget """
+            depth = max(depth, sum([ len(queue) for queue in queues.values() ]))
+            release(target)
+            released += 1
+        self.metrics = {
+            'paced': released,
+            'dropped': total - released,
+            'queueDepth': depth,
+            'lagMax': lags and max(lags) or 0,
+            'lagAvg': lags and sum(lags) / len(lags) or 0,
+        }
+        if self.metrics['dropped']:
+            log.warning("Health Check pacer dropped %d of %d probes, the rate budget is too small for the hosts"%(
+                self.metrics['dropped'], total))
+        return self.metrics
+
+    def getMetrics(self):
+        return dict(self.metrics)
@@ -0,0 +1,137 @@
+"""The Resolver API
+
+Provides the Resolver class, an in-process cache of host name lookups
+for the health check connections, with negative caching, a background
+refresh before entries expire and the stored HOST_IP as a fallback.
+"""
+import time
+import socket
+import logging
+import threading
+
+log = logging.getLogger(__name__)
+
+class Entry:
+
+    def __init__(self, address=None, error=None, expires=0, refreshAt=0):
+        self.address   = address
+        self.error     = error
+        self.expires   = expires
+        self.refreshAt = refreshAt
+
+
+class Resolver:
+    """ caches each name's address for ttl seconds and each failure for negativeTtl seconds,
+        a lookup after refresh of the ttl has passed answers from the cache and looks the
+        name up again in the background, a lookup that takes longer than timeout answers
+        with the last known address or the fallback
+    """
+
+    def __init__(self, ttl=300, negativeTtl=30, refresh=0.8, timeout=0.5, lookup=None):
+        self.ttl         = float(ttl)
+        self.negativeTtl = float(negativeTtl)
+        self.refresh     = float(refresh)
+        self.timeout     = float(timeout)
+        self.lookup      = lookup or socket.gethostbyname
+        self.entries     = { }
+        self.fallbacks   = { }
+        self.pending     = { }
+        self.lock        = threading.Lock()
+        self.hits        = 0
+        self.misses      = 0
+        self.failures    = 0
+
+    def setFallbacks(self, addresses=None):
+        """ the stored address to use for each name that cannot be resolved """
+        self.lock.acquire()
+        try:
+            self.fallbacks.update(addresses or { })
+        finally:
+            self.lock.release()
+
+    def resolve(self, name):
+        """ the address of name, raises socket.gaierror when there is neither one nor a fallback """
+        if isAddress(name):
+            return name
+        now = time.time()
+        self.lock.acquire()
+        try:
+            entry = self.entries.get(name)
+            if entry and now < entry.expires:
+                self.hits += 1
+                if entry.address and now >= entry.refreshAt:
+                    self._start(name)
+                return self._answer(name, entry)
+            self.misses += 1
+            done = self._start(name)
+        finally:
+            self.lock.release()
+        done.wait(self.timeout)
+        self.lock.acquire()
+        try:
+            entry = self.entries.get(name)
+            if not done.isSet():
+                log.warning("Resolving %s took over %ss"%(name, self.timeout))
+                if not entry or not entry.address:
+                    entry = Entry(error='lookup timed out')
+            return self._answer(name, entry)
+        finally:
+            self.lock.release()
+
+    def getMetrics(self):
+        return { 'hits': self.hits, 'misses': self.misses, 'failures': self.failures, 'names': len(self.entries) }
+
+    def _answer(self, name, entry):
+        if entry.address:
+            return entry.address
+        if self.fallbacks.get(name):
+            return self.fallbacks[name]
+        raise socket.gaierror(entry.error)
+
+    def _start(self, name):
+        """ look the name up on its own thread, unless it already is, returns the event set when done """
+        done = self.pending.get(name)
+        if done:
+            return done
+        done = self.pending[name] = threading.Event()
+        thread = threading.Thread(target=self._lookup, args=(name, done), name='resolve-%s'%name)
+        thread.setDaemon(True)
+        thread.start()
+        return done
+
+    def _lookup(self, name, done):
+        try:
+            address = self.lookup(name)
+            error   = None
+        except Exception, e:
+            address = None
+            error   = str(e) or e.__class__.__name__
+        now = time.time()
+        self.lock.acquire()
+        try:
+            if address:
+                self.entries[name] = Entry(address, None, now + self.ttl, now + self.ttl * self.refresh)
+            else:
+                log.error("Resolving %s failed: %s"%(name, error))
+                self.failures += 1
+                previous = self.entries.get(name)
+                if previous and previous.address and now < previous.expires:
+                    """ a failed refresh keeps the address until it expires """
+                    previous.refreshAt = previous.expires
+                else:
+                    self.entries[name] = Entry(None, error, now + self.negativeTtl)
+            del self.pending[name]
+        finally:
+            self.lock.release()
+            done.set()
+
+
+def isAddress(name):
+    try:
+        socket.inet_aton(name)
+    except (socket.error, TypeError):
+        return False
+    return name.count('.') == 3
+
+
+RESOLVER = Resolver()
@@ -0,0 +1,105 @@
+"""Stub health-check backends
+
+Provides the StubServer class, a local HTTP server answering /health-check
+requests, for the tests and benchmarks, and newStub() for the fast, slow,
+hang, flap and large backends the benchmarks mix.
+"""
+import time
+import socket
+import threading
+import SocketServer
+import BaseHTTPServer
+
+TOKEN = 'SCALL-OK'
+MODES = {
+    'fast':  { },
+    'slow':  { 'delay': 0.5 },
+    'hang':  { 'hang': True },
+    'flap':  { 'flap': 1 },
+    'large': { 'padding': 1048576 },
+}
+
+class StubHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    wbufsize         = -1
+
+    def do_GET(self):
+        server = self.server
+        server.requests += 1
+        if server.hang:
+            """ never answer, until the server stops """
+            server.released.wait()
+            return
+        if server.delay:
+            time.sleep(server.delay)
+        body = server.body
+        code = 200
+        if server.flap and (server.requests - 1) / server.flap % 2:
+            body = 'DOWN'
+            code = 503
+        self.send_response(code)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        if not server.keepalive:
+            """ drop the socket without telling the client, like an idle timeout """
+            self.close_connection = 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """ a health-check backend on a random local port """
+    daemon_threads      = True
+    allow_reuse_address = True
+
+    def __init__(self, delay=0, body=TOKEN, keepalive=True, hang=False, flap=0, padding=0):
+        """ flap fails every other run of flap requests, padding puts that many bytes before the body """
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), StubHandler)
+        self.delay       = delay
+        self.body        = 'x' * padding + body
+        self.keepalive   = keepalive
+        self.hang        = hang
+        self.flap        = flap
+        self.released    = threading.Event()
+        self.requests    = 0
+        self.connections = 0
+        self.sockets     = [ ]
+        self.thread      = None
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def process_request(self, request, client_address):
+        self.connections += 1
+        self.sockets.append(request)
+        SocketServer.ThreadingMixIn.process_request(self, request, client_address)
+
+    def handle_error(self, request, client_address):
+        """ clients hanging up early is expected """
+        pass
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, args=(0.05,))
+        self.thread.setDaemon(True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.released.set()
+        self.shutdown()
+        self.server_close()
+        """ hang up on idle keep-alive clients so no handler outlives the server """
+        for request in self.sockets:
+            try:
+                request.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+
+
+def newStub(mode='fast'):
+    """ a started StubServer behaving like one of the MODES """
+    return StubServer(**MODES[mode]).start()
@@ -0,0 +1,198 @@
+"""The Probe Supervisor API
+
+Provides the Supervisor class, which forks worker processes that each
+probe a stable shard of the hosts with their own HealthCheck, connection
+pool and circuit breaker, and merges their results back into the parent,
+the same fan-out as the Perl CLI::Cluster fork_processes.
+"""
+import time
+import zlib
+import select
+import signal
+import logging
+import threading
+import multiprocessing
+
+from collections import namedtuple
+
+from sitemonitor.lib.healthcheck import ProbePlan, newResult
+
+log = logging.getLogger(__name__)
+
+Target = namedtuple('Target', 'id name port vip ip')
+
+def shardOf(target, shards):
+    """ the worker a (name, port) target belongs to, the same in every process and run """
+    return (zlib.crc32('%s:%d'%target) & 0xffffffff) % shards
+
+
+def runWorker(index, tasks, results, factory):
+    """ the worker process, probes each shard it is sent and streams the results back,
+        results is this worker's own pipe so dying mid write cannot block the other workers
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    healthcheck = factory()
+    lock        = threading.Lock()
+    def send(message):
+        lock.acquire()
+        try:
+            results.send(message)
+        finally:
+            lock.release()
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        cycle, targets, deadline = task
+        healthcheck.deadline = deadline
+        plan = ProbePlan([ Target(target, target[0], target[1], vip, ip) for target, vip, ip in targets ])
+        sent = set()
+        def publish(batch):
+            sent.update(batch.keys())
+            send((cycle, batch, None))
+        probed = healthcheck.checkPlan(plan, callback=publish)
+        """ the probes that missed the deadline were not published as they finished """
+        late = dict([ (target, result) for target, result in probed.items() if target not in sent ])
+        if late:
+            send((cycle, late, None))
+        send((cycle, None, healthcheck.getPacing()))
+
+
+class Supervisor:
+    """ probes a ProbePlan across worker processes, a drop in for HealthCheck in the Scheduler,
+        factory builds the HealthCheck of each worker after it forks
+    """
+
+    def __init__(self, workers=4, factory=None, deadline=30):
+        self.workers   = int(workers)
+        self.factory   = factory
+        self.deadline  = float(deadline)
+        self.processes = [ None ] * self.workers
+        self.tasks     = [ None ] * self.workers
+        self.results   = [ None ] * self.workers
+        self.cycle     = 0
+        self.restarts  = 0
+        self.pacing    = { }
+
+    def start(self):
+        for index in range(self.workers):
+            process = self.processes[index]
+            if process and not process.is_alive():
+                log.error("Health Check worker %d died with exit code %s between cycles, restarting it"%(index, process.exitcode))
+                self.restarts += 1
+            if not process or not process.is_alive():
+                self._startWorker(index)
+        return self
+
+    def stop(self):
+        for index in range(self.workers):
+            if self.processes[index] and self.processes[index].is_alive():
+                self.tasks[index].put(None)
+        for process in self.processes:
+            if process:
+                process.join(1)
+                if process.is_alive():
+                    process.terminate()
+
+    def checkPlan(self, plan=None, matcher=None, callback=None):
+        """ the same as HealthCheck.checkPlan, with the workers' own matcher, a worker that dies
+            mid cycle is restarted and sent what it had left of its shard, so the cycle still
+            covers every target, what a worker finished without probing was dropped by its pacer
+        """
+        results = { }
+        if not plan or not plan.targets:
+            return results
+        self.start()
+        self.cycle += 1
+        self.pacing = { }
+        expires = time.time() + self.deadline
+        pending = { }
+        dropped = set()
+        for target in plan.targets.keys():
+            pending.setdefault(shardOf(target, self.workers), set()).add(target)
+        for index, shard in pending.items():
+            self._send(index, shard, plan, self.deadline)
+        while pending:
+            remaining = expires - time.time()
+            if remaining <= 0:
+                break
+            for index, cycle, batch, pacing in self._receive(min(0.5, remaining)):
+                if cycle != self.cycle or not pending.has_key(index):
+                    """ left over from a cycle that missed its deadline """
+                    continue
+                if batch is None:
+                    self._addPacing(pacing)
+                    dropped.update(pending.pop(index))
+                    continue
+                for target, result in batch.items():
+                    results[target] = result
+                    pending[index].discard(target)
+                if callback:
+                    callback(plan.fanOut(batch))
+            self._reassign(pending, plan, expires)
+        for target in plan.targets.keys():
+            if not results.has_key(target) and target not in dropped:
+                log.warning("Health Check deadline exceeded for %s:%s"%target)
+                results[target] = newResult(target[0], target[1], 'deadline exceeded')
+        return plan.fanOut(results)
+
+    def getPacing(self):
+        """ the pacing of the last cycle over every worker """
+        return dict(self.pacing)
+
+    def _addPacing(self, pacing=None):
+        for key, value in (pacing or { }).items():
+            if key in ('paced', 'dropped'):
+                self.pacing[key] = self.pacing.get(key, 0) + value
+            elif key != 'lagAvg':
+                self.pacing[key] = max(self.pacing.get(key, 0), value)
+
+    def _receive(self, timeout):
+        """ the (index, cycle, batch, pacing) messages from every worker, waits up to timeout for one """
+        readers = dict([ (self.results[index].fileno(), index) for index in range(self.workers) ])
+        try:
+            ready = select.select(readers.keys(), [ ], [ ], timeout)[0]
+        except select.error:
+            return [ ]
+        messages = [ ]
+        for fileno in ready:
+            index  = readers[fileno]
+            reader = self.results[index]
+            try:
+                while reader.poll():
+                    messages.append((index, ) + reader.recv())
+            except (EOFError, IOError):
+                """ the worker died, _reassign restarts it """
+                pass
+        return messages
+
+    def _send(self, index, shard, plan, deadline):
+        shard = [ (target, plan.vips.get(target), plan.addresses.get(target[0])) for target in shard ]
+        self.tasks[index].put((self.cycle, shard, deadline))
+
+    def _reassign(self, pending, plan, expires):
+        """ restart any worker that died holding a shard and resend the targets it had left """
+        for index, shard in pending.items():
+            if self.processes[index].is_alive():
+                continue
+            log.error("Health Check worker %d died with exit code %s, restarting it with %d targets"%(
+                index, self.processes[index].exitcode, len(shard)))
+            self.restarts += 1
+            self._startWorker(index)
+            if shard:
+                self._send(index, shard, plan, max(0, expires - time.time()))
+            else:
+                del pending[index]
+
+    def _startWorker(self, index):
+        if self.results[index]:
+            self.results[index].close()
+        self.tasks[index] = multiprocessing.Queue()
+        self.results[index], writer = multiprocessing.Pipe(False)
+        process = multiprocessing.Process(
+            target=runWorker, name='healthcheck-worker-%d'%index,
+            args=(index, self.tasks[index], writer, self.factory))
+        process.daemon = True
+        process.start()
+        writer.close()
+        self.processes[index] = process
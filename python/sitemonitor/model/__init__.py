@@ -1,35 +1,40 @@
 """The application's model objects"""
 import logging
 import datetime as date
-import re as regexp
-import socket
+import simplejson as json
 
-from sqlalchemy import orm, Table, Column, Numeric, Integer, String, ForeignKey, Sequence, Unicode, CLOB, select, func, desc
-from sqlalchemy.orm import relation, backref
-from sqlalchemy.types import DateTime
+from collections import namedtuple
+
+from sqlalchemy import orm, Table, Column, Index, Numeric, Integer, String, ForeignKey, Sequence, Unicode, CLOB, func, desc
+from sqlalchemy.orm import relation, backref, subqueryload
+from sqlalchemy.types import DateTime, Float
+from sqlalchemy.exc import InvalidRequestError
 from sqlalchemy.ext.declarative import declarative_base
 
 from pylons import config
-from urllib import urlencode
-from urllib2 import Request, urlopen, URLError
 
-from sitemonitor.model import meta
+from sitemonitor.model import meta, ids, engines
+from sitemonitor.lib.healthcheck import probe
+from sitemonitor.lib.histogram import Histogram
 
-ORMBase = declarative_base()
+ORMBase = declarative_base(metadata=meta.metadata)
 log     = logging.getLogger(__name__)
-timeout = 2
 
-socket.setdefaulttimeout(timeout)
+# ids per IN list, Oracle allows at most 1000
+IN_CHUNK = 500
 
-def init_model(engine):
-    """Call me before using any of the tables or classes in the model"""
+def init_model(engine, replica=None, sticky=5):
+    """Call me before using any of the tables or classes in the model,
+    the queries of read-only actions go to the replica engine when there is one
+    """
     ## Reflected tables must be defined and mapped here
     #global reflected_table
     #reflected_table = sa.Table("Reflected", meta.metadata, autoload=True,
     #                           autoload_with=engine)
     #orm.mapper(Reflected, reflected_table)
     #
-    smMeta = orm.sessionmaker(autoflush=True, autocommit=False, bind=engine)
+    engines.ROUTER.configure(engine, replica, sticky)
+    smMeta = orm.sessionmaker(autoflush=True, autocommit=False, bind=engine, class_=engines.RoutingSession)
     meta.engine  = engine
     meta.Session = orm.scoped_session(smMeta)
 
@@ -121,67 +126,26 @@ siteHost = Table('SITE_HOST', ORMBase.metadata,
     """
 
 
-"""Site objects"""
-class Site(ORMBase):
-    """
-    DROP TABLE SITE;
-    CREATE TABLE SITE (
-            SITE_ID       NUMBER(38) NOT NULL,
-            SITE_NAME     VARCHAR2(100) NOT NULL,
-            END_POINT     VARCHAR2(100) NOT NULL,
-            COUNTRY_CODE  VARCHAR(2) NOT NULL,
-            CREATED_DATE  DATE DEFAULT CURRENT_TIMESTAMP NOT NULL,
-            CONSTRAINT PK_VERSION PRIMARY KEY (SITE_ID)
-    );
-
-    INSERT INTO SITE (SITE_ID, SITE_NAME, END_POINT, COUNTRY_CODE) VALUES (1, 'Publisher US', 'publisher', 'US');
-    INSERT INTO SITE (SITE_ID, SITE_NAME, END_POINT, COUNTRY_CODE) VALUES (2, 'Publisher GB', 'publisher', 'GB');
-    INSERT INTO SITE (SITE_ID, SITE_NAME, END_POINT, COUNTRY_CODE) VALUES (3, 'Publisher DE', 'publisher', 'DE');
-    INSERT INTO SITE (SITE_ID, SITE_NAME, END_POINT, COUNTRY_CODE) VALUES (4, 'Publisher FR', 'publisher', 'FR');
-    SELECT * FROM SITE;
+def getObjectsByIds(cls, ids=None, strict=False):
+    """ the objects of a mapped class with these ids, in the order of the ids, with one IN query
+        per IN_CHUNK ids, missing ids are left out or, when strict, all reported in one error
     """
+    ids     = [ int(id) for id in ids or [ ] ]
+    objects = { }
+    unique  = list(set(ids))
+    for i in range(0, len(unique), IN_CHUNK):
+        for object in meta.Session.query(cls).filter(cls.id.in_(unique[i:i + IN_CHUNK])):
+            objects[object.id] = object
+    missing = [ id for id in ids if not objects.has_key(id) ]
+    if missing and strict:
+        raise InvalidRequestError('No %s with id %s'%(cls.__name__, ', '.join([ str(id) for id in missing ])))
+    return [ objects[id] for id in ids if objects.has_key(id) ]
 
-    __tablename__ = 'SITE'
-
-    id            = Column('SITE_ID', Integer, primary_key=True)
-    name          = Column('SITE_NAME', String(100), nullable=False)
-    endPoint      = Column('END_POINT', String(100), nullable=False)
-    countryCode   = Column('COUNTRY_CODE', String(2), nullable=False)
-    createdDate   = Column('CREATED_DATE', DateTime, nullable=False)
-    hosts         = relation('Host', secondary=siteHost, backref='hosts', lazy=False)
-    monitors      = relation('Monitor', secondary=siteMonitor, backref='monitors', lazy=False)
-
-    def getMaxId(self):
-        max = meta.Session.query(self.__class__).from_statement(
-            select(
-                [self.__mapper__._with_polymorphic_selectable],
-                select([func.max(self.__mapper__.c.id)]).label('id')==self.__mapper__.c.id)
-        ).first()
-        if max:
-            self.id = max.id + 1
-        else:
-            self.id = 1
-
-    def getAll(self):
-        return meta.Session.query(self.__class__).all()
 
-    def getById(self, id=None):
-        if not id: return
-        return meta.Session.query(self.__class__).filter_by(id=id).one()
+class SiteLayout(object):
+    """ the end point and monitor columns of a site, shared by Site and its snapshots """
 
-    def getByName(self, name=None):
-        if not name: return
-        return meta.Session.query(self.__class__).filter_by(name=name).one()
-
-    def getByCountryName(self, country=None, name=None):
-        if not country or not name: return
-        return meta.Session.query(self.__class__).filter_by(countryCode=country, endPoint=name).one()
-
-    def getSet(self, limit=10, offset=0):
-        return meta.Session.query(self.__class__).order_by(self.__class__.id).limit(limit).offset(offset).all()
-
-    def getTotal(self):
-        return meta.Session.query(self.__class__).count()
+    __slots__ = ( )
 
     def getEndPoint(self):
         return '%s/%s'%(self.countryCode, self.endPoint)
@@ -219,20 +183,128 @@ class Site(ORMBase):
             ordered.append(hash[item])
         return ordered
 
+
+"""Site objects"""
+class Site(ORMBase, SiteLayout):
+    """
+    DROP TABLE SITE;
+    CREATE TABLE SITE (
+            SITE_ID       NUMBER(38) NOT NULL,
+            SITE_NAME     VARCHAR2(100) NOT NULL,
+            END_POINT     VARCHAR2(100) NOT NULL,
+            COUNTRY_CODE  VARCHAR(2) NOT NULL,
+            CREATED_DATE  DATE DEFAULT CURRENT_TIMESTAMP NOT NULL,
+            CONSTRAINT PK_VERSION PRIMARY KEY (SITE_ID)
+    );
+    CREATE INDEX IX_SITE_COUNTRY_END_POINT ON SITE (COUNTRY_CODE, END_POINT);
+
+    INSERT INTO SITE (SITE_ID, SITE_NAME, END_POINT, COUNTRY_CODE) VALUES (1, 'Publisher US', 'publisher', 'US');
+    INSERT INTO SITE (SITE_ID, SITE_NAME, END_POINT, COUNTRY_CODE) VALUES (2, 'Publisher GB', 'publisher', 'GB');
+    INSERT INTO SITE (SITE_ID, SITE_NAME, END_POINT, COUNTRY_CODE) VALUES (3, 'Publisher DE', 'publisher', 'DE');
+    INSERT INTO SITE (SITE_ID, SITE_NAME, END_POINT, COUNTRY_CODE) VALUES (4, 'Publisher FR', 'publisher', 'FR');
+    SELECT * FROM SITE;
+    """
+
+    __tablename__ = 'SITE'
+
+    id            = Column('SITE_ID', Integer, primary_key=True)
+    name          = Column('SITE_NAME', String(100), nullable=False)
+    endPoint      = Column('END_POINT', String(100), nullable=False)
+    countryCode   = Column('COUNTRY_CODE', String(2), nullable=False)
+    createdDate   = Column('CREATED_DATE', DateTime, nullable=False)
+    hosts         = relation('Host', secondary=siteHost, backref='hosts')
+    monitors      = relation('Monitor', secondary=siteMonitor, backref='monitors')
+
+    def getMaxId(self):
+        self.id = ids.ALLOCATOR.nextId(self.__class__)
+
+    def getQuery(self, load=None):
+        """ a query of the sites that loads each relation named in load up front, with one query
+            per relation instead of a join, the others load when they are first used
+        """
+        query = meta.Session.query(self.__class__)
+        for name in load or ( ):
+            query = query.options(subqueryload(name))
+        return query
+
+    def getAll(self, load=None):
+        return self.getQuery(load).all()
+
+    def getSummaries(self):
+        """ the id, name and end point of every site without their hosts or monitors, for the site dropdown """
+        query = meta.Session.query(Site.id, Site.name, Site.endPoint, Site.countryCode)
+        return [ SiteSummary(*row) for row in query.order_by(Site.id) ]
+
+    def getById(self, id=None, load=None):
+        if not id: return
+        return self.getQuery(load).filter_by(id=id).one()
+
+    def getByName(self, name=None):
+        if not name: return
+        return meta.Session.query(self.__class__).filter_by(name=name).one()
+
+    def getByCountryName(self, country=None, name=None, load=None):
+        if not country or not name: return
+        return self.getQuery(load).filter_by(countryCode=country, endPoint=name).one()
+
+    def getSet(self, limit=10, offset=0, load=None):
+        return self.getQuery(load).order_by(self.__class__.id).limit(limit).offset(offset).all()
+
+    def getPage(self, limit=10, after=None, before=None, load=None):
+        """ the limit sites by id after, or before, a site id, seeks on the primary key so every page
+            costs the same, returns the sites and whether there are more past them
+        """
+        query = self.getQuery(load)
+        if before is not None:
+            query = query.filter(self.__class__.id < before).order_by(self.__class__.id.desc())
+        else:
+            if after is not None:
+                query = query.filter(self.__class__.id > after)
+            query = query.order_by(self.__class__.id)
+        sites = query.limit(limit + 1).all()
+        more  = len(sites) > limit
+        sites = sites[:limit]
+        if before is not None:
+            sites.reverse()
+        return sites, more
+
+    def getStatusRows(self, country=None, vip=None):
+        """ one row per site and host in a single query, for the bulk status of every site """
+        query = meta.Session.query(
+            Site.id.label('siteId'), Site.name.label('siteName'), Site.endPoint, Site.countryCode,
+            Host.id.label('hostId'), Host.name.label('hostName'), Host.port.label('hostPort'), Host.vip
+        ).outerjoin((siteHost, siteHost.c.SITE_ID==Site.id)).outerjoin((Host, Host.id==siteHost.c.HOST_ID))
+        if country:
+            query = query.filter(Site.countryCode==country)
+        if vip:
+            query = query.filter(Host.vip==vip)
+        return query.order_by(Site.id, Host.id).all()
+
+    def getSnapshots(self):
+        """ an immutable SiteSnapshot of every site keyed by (countryCode, endPoint), in three queries """
+        hostIds  = { }
+        monitors = { }
+        for siteId, hostId in meta.Session.query(siteHost.c.SITE_ID, siteHost.c.HOST_ID).order_by(siteHost.c.HOST_ID):
+            hostIds.setdefault(siteId, [ ]).append(hostId)
+        for row in meta.Session.query(siteMonitor.c.SITE_ID, Monitor.id, Monitor.name, Monitor.endPoint).filter(
+                Monitor.id==siteMonitor.c.MONITOR_ID):
+            monitors.setdefault(row[0], [ ]).append(MonitorSummary(*row[1:]))
+        sites = { }
+        for site in self.getSummaries():
+            sites[(site.countryCode, site.endPoint)] = SiteSnapshot(
+                *(site + (tuple(hostIds.get(site.id, ( ))), tuple(monitors.get(site.id, ( ))))))
+        return sites
+
     def setMonitorData(self, data=None):
         if not data:
             return self
-        self.monitors = [ ]
-        for id in data.getall('site_monitor'):
-            self.monitors.append(Monitor().getById(id))
+        self.monitors = Monitor().getByIds(data.getall('site_monitor'), strict=True)
         return self.monitors
 
     def setHostData(self, data=None):
         if not data:
             return self
-        self.hosts = [ ]
-        for id in data.getall('site_host'):
-            self.hosts.append(Host().getById(id))
+        self.hosts = Host().getByIds(data.getall('site_host'), strict=True)
         return self.hosts
 
     def addObject(self):
@@ -243,6 +315,21 @@ class Site(ORMBase):
         return meta.Session.delete(self)
 
 
+class SiteSummary(namedtuple('SiteSummary', 'id name endPoint countryCode'), SiteLayout):
+    """ the columns of a Site the site dropdown shows """
+
+    __slots__ = ( )
+
+
+class SiteSnapshot(namedtuple('SiteSnapshot', 'id name endPoint countryCode hostIds monitors'), SiteLayout):
+    """ a Site as the monitor panels see it, with the ids of its hosts and a MonitorSummary per monitor """
+
+    __slots__ = ( )
+
+
+MonitorSummary = namedtuple('MonitorSummary', 'id name endPoint')
+
+
 """Monitor objects"""
 class Monitor(ORMBase):
     """
@@ -272,15 +359,7 @@ class Monitor(ORMBase):
     createdDate   = Column('CREATED_DATE', DateTime, nullable=False)
 
     def getMaxId(self):
-        max = meta.Session.query(self.__class__).from_statement(
-            select(
-                [self.__mapper__._with_polymorphic_selectable],
-                select([func.max(self.__mapper__.c.id)]).label('id')==self.__mapper__.c.id)
-        ).first()
-        if max:
-            self.id = max.id + 1
-        else:
-            self.id = 1
+        self.id = ids.ALLOCATOR.nextId(self.__class__)
 
     def getAll(self):
         return meta.Session.query(self.__class__).order_by(self.__class__.id).all()
@@ -289,6 +368,9 @@ class Monitor(ORMBase):
         if not id: return
         return meta.Session.query(self.__class__).filter_by(id=id).one()
 
+    def getByIds(self, ids=None, strict=False):
+        return getObjectsByIds(self.__class__, ids, strict)
+
 
 """Application objects"""
 class Application(ORMBase):
@@ -309,15 +391,7 @@ class Application(ORMBase):
     applicationUrl  = Column('APPLICATION_URL', String(1000))
 
     def getMaxId(self):
-        max = meta.Session.query(self.__class__).from_statement(
-            select(
-                [self.__mapper__._with_polymorphic_selectable],
-                select([func.max(self.__mapper__.c.id)]).label('id')==self.__mapper__.c.id)
-        ).first()
-        if max:
-            self.id = max.id + 1
-        else:
-            self.id = 1
+        self.id = ids.ALLOCATOR.nextId(self.__class__)
 
     def getAll(self):
         return meta.Session.query(self.__class__).order_by(self.__class__.id).all()
@@ -347,6 +421,8 @@ class Host(ORMBase):
         STATUS     Integer NOT NULL,
         CONSTRAINT PK_HOST PRIMARY KEY (HOST_ID)
     );
+    CREATE INDEX IX_HOST_VIP_NAME ON HOST (VIP_NAME);
+    CREATE INDEX IX_HOST_NAME_PORT ON HOST (HOST_NAME, HOST_PORT);
 
     SELECT * FROM HOST;
     """
@@ -362,22 +438,10 @@ class Host(ORMBase):
     healthCheck     = ''
 
     def getMaxId(self):
-        max = meta.Session.query(self.__class__).from_statement(
-            select(
-                [self.__mapper__._with_polymorphic_selectable],
-                select([func.max(self.__mapper__.c.id)]).label('id')==self.__mapper__.c.id)
-        ).first()
-        if max:
-            self.id = max.id + 1
-        else:
-            self.id = 1
-
-    def getVipNames(self):
-        return meta.Session.query(self.__class__).group_by(self.__mapper__.c.vip).all()
-
-    def getByVip(self, vip=None):
-        if not vip: return
-        return meta.Session.query(self.__class__).filter_by(vip=vip).all()
+        """ HOST is the collector's, perl/lib/SiteMonitor.pm numbers its rows MAX(HOST_ID)+1, so
+            it is kept out of ID_BLOCK, a block reserved here would collide with the next a10_hosts run
+        """
+        self.id = (meta.Session.query(func.max(self.__class__.id)).scalar() or 0) + 1
 
     def getAll(self):
         return meta.Session.query(self.__class__).order_by(self.__class__.id).all()
@@ -386,31 +450,23 @@ class Host(ORMBase):
         if not id: return
         return meta.Session.query(self.__class__).filter_by(id=id).one()
 
+    def getByIds(self, ids=None, strict=False):
+        return getObjectsByIds(self.__class__, ids, strict)
+
+    def getProbeTargets(self):
+        """ one (id, name, ip, port, vip, status, siteId) row per site referencing a host, and one for each host without a site """
+        return meta.Session.query(
+            self.__class__.id, self.__class__.name, self.__class__.ip, self.__class__.port, self.__class__.vip,
+            self.__class__.status, siteHost.c.SITE_ID.label('siteId')
+        ).outerjoin((siteHost, siteHost.c.HOST_ID==self.__class__.id)).all()
+
     def getHealthCheck(self, host=None, port=None):
         if not host:
             host = self.name
         if not port:
             port = self.port
-        else:
-            port = 80
-        url = 'http://%s:%s/health-check'%(host, port)
-        log.warning(url)
-        try:
-            f = urlopen(url)
-            content = f.read()
-        except URLError, e:
-            log.error(e)
-            self.healthCheck = 0
-            return ''
-        try:
-            reg   = regexp.compile('SCALL-OK')
-            match = reg.search(content)
-            if match:
-                self.healthCheck = 1
-            else:
-                self.healthCheck = 0
-        except Exception, e:
-            log.error(e)
+        result = probe(host, port)
+        self.healthCheck = result['status']
         return ''
 
     def addObject(self):
@@ -432,6 +488,7 @@ class Preference(ORMBase):
         CONSTRAINT PK_PREFERENCE PRIMARY KEY (PREFERENCE_ID),
         CONSTRAINT FK_SITE_ID FOREIGN KEY (SITE_ID) REFERENCES SITE (SITE_ID)
     );
+    CREATE INDEX IX_PREFERENCE_SITE_ID ON PREFERENCE (SITE_ID);
 
     SELECT * FROM PREFERENCE;
     """
@@ -443,15 +500,7 @@ class Preference(ORMBase):
     siteId          = Column('SITE_ID', Integer)
 
     def getMaxId(self):
-        max = meta.Session.query(self.__class__).from_statement(
-            select(
-                [self.__mapper__._with_polymorphic_selectable],
-                select([func.max(self.__mapper__.c.id)]).label('id')==self.__mapper__.c.id)
-        ).first()
-        if max:
-            self.id = max.id + 1
-        else:
-            self.id = 1
+        self.id = ids.ALLOCATOR.nextId(self.__class__)
 
     def getAll(self):
         return meta.Session.query(self.__class__).order_by(self.__class__.id).all()
@@ -475,8 +524,18 @@ class Preference(ORMBase):
         return result
 
     def getData(self):
-        data = eval(self.string)
-        return data
+        """ the stored json, None if it does not decode """
+        try:
+            return json.loads(self.string)
+        except ValueError, e:
+            log.error("Preferences %s of site %s are not json: %s"%(self.id, self.siteId, e))
+            return None
+
+    def getDataBySiteId(self, siteId=None):
+        """ the decoded preferences of a site, None if it has none, app_globals.preferences caches them """
+        if not siteId: return
+        prefs = self.getBySiteId(siteId)
+        return prefs and prefs.getData() or None
 
     def save(self, siteId=None, string=None):
         if not siteId or not string: return
@@ -497,3 +556,234 @@ class Preference(ORMBase):
         return meta.Session.delete(self)
 
 
+"""Health Check History objects"""
+class HealthHistory(ORMBase):
+    """
+    DROP TABLE HEALTH_HISTORY;
+    CREATE TABLE HEALTH_HISTORY (
+        HISTORY_ID    NUMBER(38) NOT NULL,
+        HOST_ID       NUMBER(38) NOT NULL,
+        STATUS        Integer NOT NULL,
+        LATENCY       FLOAT NULL,
+        ERROR         VARCHAR2(255) NULL,
+        MATCHED_AT    NUMBER(38) NULL,
+        BYTES_READ    NUMBER(38) NULL,
+        CHECKED_DATE  DATE NOT NULL,
+        CONSTRAINT PK_HEALTH_HISTORY PRIMARY KEY (HISTORY_ID),
+        CONSTRAINT FK_HH_HOST_ID FOREIGN KEY (HOST_ID) REFERENCES HOST (HOST_ID)
+    );
+
+    SELECT * FROM HEALTH_HISTORY;
+    """
+
+    __tablename__   = 'HEALTH_HISTORY'
+
+    id              = Column('HISTORY_ID', Integer, primary_key = True)
+    hostId          = Column('HOST_ID', Integer, ForeignKey('HOST.HOST_ID'), nullable=False)
+    status          = Column('STATUS', Integer, nullable=False)
+    latency         = Column('LATENCY', Float)
+    error           = Column('ERROR', String(255))
+    matchedAt       = Column('MATCHED_AT', Integer)
+    bytesRead       = Column('BYTES_READ', Integer)
+    checkedDate     = Column('CHECKED_DATE', DateTime, nullable=False)
+
+    def getMaxId(self):
+        self.id = ids.ALLOCATOR.nextId(self.__class__)
+
+    def getByHostId(self, hostId=None, since=None):
+        if not hostId: return
+        query = meta.Session.query(self.__class__).filter_by(hostId=hostId)
+        if since:
+            query = query.filter(self.__class__.checkedDate >= since)
+        return query.order_by(self.__class__.checkedDate).all()
+
+    def recordResults(self, results=None):
+        """ add a raw sample per host id in a hash of health check results and roll them up """
+        if not results:
+            return
+        nextIds = ids.ALLOCATOR.nextIds(self.__class__, len(results))
+        rollup  = HealthRollup()
+        samples = [ ]
+        for hostId, result in results.items():
+            sample             = self.__class__()
+            sample.id          = nextIds.pop(0)
+            sample.hostId      = hostId
+            sample.status      = result['status']
+            sample.latency     = result['latency']
+            sample.error       = result['error'] and result['error'][:255]
+            sample.matchedAt   = result.get('matchedAt')
+            sample.bytesRead   = result.get('bytesRead')
+            sample.checkedDate = date.datetime.fromtimestamp(result['checked'])
+            meta.Session.add(sample)
+            samples.append(sample)
+        rollups = rollup.getBuckets(samples)
+        for sample in samples:
+            rollup.addSample(sample, rollups)
+
+    def purge(self, before=None):
+        """ raw samples older than the rollups need are safe to delete """
+        if not before: return
+        return meta.Session.query(self.__class__).filter(self.__class__.checkedDate < before).delete(synchronize_session=False)
+
+
+"""Health Check Rollup objects"""
+class HealthRollup(ORMBase):
+    """
+    DROP TABLE HEALTH_ROLLUP;
+    CREATE TABLE HEALTH_ROLLUP (
+        HOST_ID        NUMBER(38) NOT NULL,
+        BUCKET_SIZE    NUMBER(38) NOT NULL,
+        BUCKET_START   DATE NOT NULL,
+        SUCCESS_COUNT  NUMBER(38) NOT NULL,
+        FAILURE_COUNT  NUMBER(38) NOT NULL,
+        LATENCY_COUNT  NUMBER(38) NOT NULL,
+        LATENCY_MIN    FLOAT NULL,
+        LATENCY_MAX    FLOAT NULL,
+        LATENCY_SUM    FLOAT NULL,
+        LATENCY_P95    FLOAT NULL,
+        HISTOGRAM      VARCHAR2(4000) NULL,
+        CONSTRAINT PK_HEALTH_ROLLUP PRIMARY KEY (HOST_ID, BUCKET_SIZE, BUCKET_START),
+        CONSTRAINT FK_HR_HOST_ID FOREIGN KEY (HOST_ID) REFERENCES HOST (HOST_ID)
+    );
+
+    SELECT * FROM HEALTH_ROLLUP;
+    """
+
+    __tablename__   = 'HEALTH_ROLLUP'
+
+    MINUTE          = 60
+    HOUR            = 3600
+    DAY             = 86400
+    BUCKETS         = (MINUTE, HOUR, DAY)
+
+    hostId          = Column('HOST_ID', Integer, ForeignKey('HOST.HOST_ID'), primary_key = True)
+    bucketSize      = Column('BUCKET_SIZE', Integer, primary_key = True)
+    bucketStart     = Column('BUCKET_START', DateTime, primary_key = True)
+    successCount    = Column('SUCCESS_COUNT', Integer, nullable=False)
+    failureCount    = Column('FAILURE_COUNT', Integer, nullable=False)
+    latencyCount    = Column('LATENCY_COUNT', Integer, nullable=False)
+    latencyMin      = Column('LATENCY_MIN', Float)
+    latencyMax      = Column('LATENCY_MAX', Float)
+    latencySum      = Column('LATENCY_SUM', Float)
+    latencyP95      = Column('LATENCY_P95', Float)
+    histogram       = Column('HISTOGRAM', String(4000))
+
+    def getBucketStart(self, checked=None, size=None):
+        if size == self.MINUTE:
+            return checked.replace(second=0, microsecond=0)
+        if size == self.HOUR:
+            return checked.replace(minute=0, second=0, microsecond=0)
+        return checked.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    def getLatencyAvg(self):
+        if not self.latencyCount:
+            return None
+        return self.latencySum / self.latencyCount
+
+    def getByHostId(self, hostId=None, size=DAY, since=None):
+        if not hostId: return
+        query = meta.Session.query(self.__class__).filter_by(hostId=hostId, bucketSize=size)
+        if since:
+            query = query.filter(self.__class__.bucketStart >= since)
+        return query.order_by(self.__class__.bucketStart).all()
+
+    def getUptime(self, hostId=None, days=30):
+        """ percentage of successful checks over the last days, read from the daily rollups """
+        if not hostId: return
+        return self.getUptimes([ hostId ], days).get(hostId)
+
+    def getUptimes(self, hostIds=None, days=30):
+        """ a hash of the uptime percentage by host id, with one query per IN_CHUNK hosts,
+            hosts without a check in the last days are left out
+        """
+        cls     = self.__class__
+        since   = self.getBucketStart(date.datetime.now() - date.timedelta(days=days - 1), self.DAY)
+        unique  = list(set([ int(id) for id in hostIds or [ ] ]))
+        counts  = { }
+        for i in range(0, len(unique), IN_CHUNK):
+            rows = meta.Session.query(cls.hostId, func.sum(cls.successCount), func.sum(cls.failureCount)).filter(
+                cls.hostId.in_(unique[i:i + IN_CHUNK])).filter_by(bucketSize=self.DAY).filter(
+                cls.bucketStart >= since).group_by(cls.hostId)
+            for hostId, success, failure in rows:
+                counts[hostId] = (success or 0, failure or 0)
+        uptimes = { }
+        for hostId, (success, failure) in counts.items():
+            if success + failure:
+                uptimes[hostId] = 100.0 * success / (success + failure)
+        return uptimes
+
+    def getBuckets(self, samples=None):
+        """ the existing rollups of every bucket of the samples, keyed by (host id, size, start),
+            with one query per IN_CHUNK hosts rather than one per bucket of each sample
+        """
+        cls     = self.__class__
+        rollups = { }
+        starts  = set()
+        hostIds = set()
+        for sample in samples or [ ]:
+            hostIds.add(sample.hostId)
+            for size in self.BUCKETS:
+                starts.add(self.getBucketStart(sample.checkedDate, size))
+        hostIds = list(hostIds)
+        for i in range(0, len(hostIds), IN_CHUNK):
+            query = meta.Session.query(cls).filter(cls.hostId.in_(hostIds[i:i + IN_CHUNK])).filter(cls.bucketStart.in_(list(starts)))
+            for rollup in query:
+                rollups[(rollup.hostId, rollup.bucketSize, rollup.bucketStart)] = rollup
+        return rollups
+
+    def addSample(self, sample=None, rollups=None):
+        """ fold a HealthHistory sample into its minute, hour and day rollups, from the rollups
+            getBuckets loaded for its cycle, the new ones are added to them
+        """
+        if not sample: return
+        if rollups is None:
+            rollups = self.getBuckets([ sample ])
+        for size in self.BUCKETS:
+            start  = self.getBucketStart(sample.checkedDate, size)
+            rollup = rollups.get((sample.hostId, size, start))
+            if not rollup:
+                rollup              = self.__class__()
+                rollup.hostId       = sample.hostId
+                rollup.bucketSize   = size
+                rollup.bucketStart  = start
+                rollup.successCount = 0
+                rollup.failureCount = 0
+                rollup.latencyCount = 0
+                meta.Session.add(rollup)
+                rollups[(sample.hostId, size, start)] = rollup
+            rollup.update(sample.status, sample.latency)
+
+    def purge(self, size=MINUTE, before=None):
+        """ the rollups of a bucket size older than its retention """
+        if not before: return
+        cls = self.__class__
+        return meta.Session.query(cls).filter_by(bucketSize=size).filter(cls.bucketStart < before).delete(synchronize_session=False)
+
+    def update(self, status=0, latency=None):
+        if status:
+            self.successCount += 1
+        else:
+            self.failureCount += 1
+        if latency is None:
+            return
+        histogram = Histogram().fromString(self.histogram)
+        histogram.add(latency)
+        self.histogram     = histogram.toString()
+        self.latencyP95    = histogram.percentile(0.95)
+        self.latencyCount += 1
+        self.latencySum    = (self.latencySum or 0) + latency
+        if self.latencyMin is None or latency < self.latencyMin:
+            self.latencyMin = latency
+        if self.latencyMax is None or latency > self.latencyMax:
+            self.latencyMax = latency
+
+
+"""Lookup indexes on the hot lookup keys, create_all makes them for a new schema
+    and the migrations add them to an existing one
+"""
+LOOKUP_INDEXES = [
+    Index('IX_SITE_COUNTRY_END_POINT', Site.__table__.c.COUNTRY_CODE, Site.__table__.c.END_POINT),
+    Index('IX_HOST_VIP_NAME', Host.__table__.c.VIP_NAME),
+    Index('IX_HOST_NAME_PORT', Host.__table__.c.HOST_NAME, Host.__table__.c.HOST_PORT),
+    Index('IX_PREFERENCE_SITE_ID', Preference.__table__.c.SITE_ID),
+]
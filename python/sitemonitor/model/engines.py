@@ -0,0 +1,156 @@
+"""The Engine API
+
+Provides newEngine, which builds the application's engine from the
+sqlalchemy.* settings, and for a SQLite database file shared with the
+Perl collector sets it up for concurrent use: WAL journaling so readers
+never wait on a writer, a busy timeout so writers wait on each other
+instead of failing with "database is locked", and a pool of connections
+that the Paste worker threads share.
+
+Also provides the RoutingSession, which sends the queries of read-only
+actions to a replica while writes and commits stay on the primary, and
+the EngineRouter that remembers the last write so reads stick to the
+primary until the replica has caught up with it.
+"""
+import time
+import logging
+import threading
+
+from paste.deploy.converters import asbool
+from sqlalchemy import engine_from_config, event
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql.expression import UpdateBase
+
+log = logging.getLogger(__name__)
+
+JOURNAL_MODES = ('delete', 'truncate', 'persist', 'memory', 'wal', 'off')
+SYNCHRONOUS   = ('off', 'normal', 'full', 'extra')
+
+class SqlitePragmas:
+    """ sets the pragmas on every new connection, the engine's connect listener """
+
+    def __init__(self, journalMode='wal', busyTimeout=5000, synchronous='normal', cacheSize=-8000):
+        journalMode = str(journalMode).lower()
+        synchronous = str(synchronous).lower()
+        if journalMode not in JOURNAL_MODES:
+            raise ValueError('sqlite.journal_mode must be one of %s'%', '.join(JOURNAL_MODES))
+        if synchronous not in SYNCHRONOUS:
+            raise ValueError('sqlite.synchronous must be one of %s'%', '.join(SYNCHRONOUS))
+        self.pragmas = [
+            ('busy_timeout', int(busyTimeout)),
+            ('journal_mode', journalMode),
+            ('synchronous', synchronous),
+            ('cache_size', int(cacheSize)),
+        ]
+
+    def __call__(self, connection, record):
+        """ in autocommit, the driver would otherwise begin a transaction the journal mode cannot change in """
+        isolation = connection.isolation_level
+        connection.isolation_level = None
+        cursor = connection.cursor()
+        try:
+            for name, value in self.pragmas:
+                cursor.execute('PRAGMA %s = %s'%(name, value))
+                cursor.fetchall()
+        finally:
+            cursor.close()
+            connection.isolation_level = isolation
+
+
+def isSqliteFile(url):
+    return url.drivername.startswith('sqlite') and url.database not in (None, '', ':memory:')
+
+
+def newEngine(config, prefix='sqlalchemy.'):
+    """ the engine of the sqlalchemy.url, with the sqlite.* profile for a SQLite database file
+        unless sqlite.profile is false
+    """
+    url = make_url(config[prefix + 'url'])
+    if not isSqliteFile(url) or not asbool(config.get('sqlite.profile', True)):
+        return engine_from_config(config, prefix)
+    pragmas = SqlitePragmas(
+        config.get('sqlite.journal_mode', 'wal'),
+        config.get('sqlite.busy_timeout', 5000),
+        config.get('sqlite.synchronous', 'normal'),
+        config.get('sqlite.cache_size', -8000))
+    """ a connection may be checked in by one worker thread and out by the next """
+    engine = engine_from_config(config, prefix,
+        poolclass=QueuePool,
+        pool_size=int(config.get('sqlite.pool_size', 10)),
+        max_overflow=int(config.get('sqlite.pool_overflow', 20)),
+        connect_args={ 'check_same_thread': False })
+    event.listen(engine, 'connect', pragmas)
+    log.info("SQLite profile for %s: %s"%(url.database, ', '.join([ '%s=%s'%pragma for pragma in pragmas.pragmas ])))
+    return engine
+
+
+class EngineRouter:
+    """ the primary and the optional replica engine, reads go to the primary for sticky seconds
+        after a write so a user reads the save they just made
+    """
+
+    def __init__(self, primary=None, replica=None, sticky=5):
+        self.primary   = primary
+        self.replica   = replica
+        self.sticky    = float(sticky)
+        self.lastWrite = 0
+        self.reads     = 0
+        self.writes    = 0
+        self.lock      = threading.Lock()
+
+    def configure(self, primary=None, replica=None, sticky=5):
+        self.lock.acquire()
+        try:
+            self.primary   = primary
+            self.replica   = replica
+            self.sticky    = float(sticky)
+            self.lastWrite = 0
+        finally:
+            self.lock.release()
+        return self
+
+    def canRead(self):
+        """ whether a read may go to the replica """
+        return self.replica is not None and time.time() - self.lastWrite >= self.sticky
+
+    def setWritten(self):
+        self.lock.acquire()
+        try:
+            self.lastWrite = time.time()
+            self.writes   += 1
+        finally:
+            self.lock.release()
+
+    def getMetrics(self):
+        return { 'replica': self.replica is not None, 'reads': self.reads, 'writes': self.writes, 'sticky': time.time() - self.lastWrite < self.sticky }
+
+
+class RoutingSession(Session):
+    """ the session of a request, a readOnly one queries the replica until it flushes or executes a write,
+        everything else, flushes and commits included, goes to the primary
+    """
+
+    def __init__(self, router=None, **kwargs):
+        Session.__init__(self, **kwargs)
+        self.router   = router or ROUTER
+        self.readOnly = False
+        self.wrote    = False
+
+    def get_bind(self, mapper=None, clause=None):
+        if self._flushing or isinstance(clause, UpdateBase):
+            self.wrote = True
+        elif self.readOnly and not self.wrote and self.router.canRead():
+            self.router.reads += 1
+            return self.router.replica
+        return self.router.primary or Session.get_bind(self, mapper, clause)
+
+    def commit(self):
+        Session.commit(self)
+        if self.wrote:
+            self.router.setWritten()
+            self.wrote = False
+
+
+ROUTER = EngineRouter()
@@ -0,0 +1,190 @@
+"""The Id Allocator API
+
+Provides the IdAllocator class, which hands out the primary keys of the
+model from blocks reserved once per process, and the sources it reserves
+them from: a database sequence where the backend has them and the
+ID_BLOCK table everywhere else.
+"""
+import os
+import logging
+import threading
+
+from sqlalchemy import Table, Column, Integer, String, Sequence, select, func, text
+from sqlalchemy.exc import IntegrityError, DBAPIError
+
+from sitemonitor.model import meta
+
+log = logging.getLogger(__name__)
+
+idBlock = Table('ID_BLOCK', meta.metadata,
+            Column('TABLE_NAME', String(30), primary_key=True),
+            Column('NEXT_ID', Integer, nullable=False)
+        )
+"""
+    DROP TABLE ID_BLOCK;
+    CREATE TABLE ID_BLOCK (
+        TABLE_NAME  VARCHAR2(30) NOT NULL,
+        NEXT_ID     NUMBER(38) NOT NULL,
+        CONSTRAINT PK_ID_BLOCK PRIMARY KEY (TABLE_NAME)
+    );
+
+    SELECT * FROM ID_BLOCK;
+"""
+
+class TableSource:
+    """ reserves a block by moving the table's ID_BLOCK.NEXT_ID past it, the row is seeded
+        from MAX(id) the first time the table asks, so existing rows are never handed out again
+    """
+
+    def __init__(self, attempts=5):
+        self.attempts = int(attempts)
+
+    def reserve(self, connection, table, size):
+        """ the (start, size) of a block of ids no other process will get """
+        for attempt in range(self.attempts):
+            transaction = connection.begin()
+            try:
+                updated = connection.execute(
+                    idBlock.update().where(idBlock.c.TABLE_NAME == table.name).values(NEXT_ID=idBlock.c.NEXT_ID + size))
+                if updated.rowcount:
+                    end = connection.execute(select([idBlock.c.NEXT_ID], idBlock.c.TABLE_NAME == table.name)).scalar()
+                    transaction.commit()
+                    return end - size, size
+                start = (connection.execute(select([func.max(getIdColumn(table))])).scalar() or 0) + 1
+                connection.execute(idBlock.insert().values(TABLE_NAME=table.name, NEXT_ID=start + size))
+                transaction.commit()
+                return start, size
+            except IntegrityError:
+                """ another process seeded the row first, take a block from it """
+                transaction.rollback()
+            except:
+                transaction.rollback()
+                raise
+        raise RuntimeError('could not reserve ids for %s after %d attempts'%(table.name, self.attempts))
+
+
+class SequenceSource:
+    """ reserves a block with one NEXTVAL of a <TABLE>_SEQ sequence that increments by the
+        block size, the sequence is created starting past MAX(id) if it does not exist yet,
+        an existing one keeps the INCREMENT BY it was created with and that is the block size
+    """
+
+    INCREMENTS = {
+        'oracle':     'SELECT INCREMENT_BY FROM USER_SEQUENCES WHERE SEQUENCE_NAME = :name',
+        'postgresql': 'SELECT INCREMENT FROM INFORMATION_SCHEMA.SEQUENCES WHERE SEQUENCE_NAME = :name',
+    }
+
+    def __init__(self, increment=100):
+        self.increment = int(increment)
+        self.sequences = { }
+
+    def reserve(self, connection, table, size):
+        sequence = self.sequences.get(table.name)
+        if not sequence:
+            sequence = self.sequences[table.name] = self._create(connection, table)
+        return connection.execute(sequence), sequence.increment
+
+    def _create(self, connection, table):
+        name = '%s_SEQ'%table.name
+        if connection.dialect.has_sequence(connection, name):
+            return Sequence(name, increment=self._getIncrement(connection, name))
+        start    = (connection.execute(select([func.max(getIdColumn(table))])).scalar() or 0) + 1
+        sequence = Sequence(name, start=start, increment=self.increment)
+        try:
+            sequence.create(bind=connection)
+        except DBAPIError, e:
+            """ another process created it first, possibly with a block size of its own """
+            log.warning("Creating %s failed, using the existing one: %s"%(name, e))
+            return Sequence(name, increment=self._getIncrement(connection, name))
+        return sequence
+
+    def _getIncrement(self, connection, name):
+        """ the INCREMENT BY of an existing sequence, a block sized by ids.block instead would
+            overlap the next one whenever the sequence was created with a smaller increment
+        """
+        query = self.INCREMENTS.get(connection.dialect.name)
+        if not query:
+            log.warning("Cannot read the increment of %s on %s, assuming %d"%(name, connection.dialect.name, self.increment))
+            return self.increment
+        increment = connection.execute(text(query), name=name).scalar()
+        if increment is None:
+            raise RuntimeError('sequence %s has no increment'%name)
+        if int(increment) != self.increment:
+            log.warning("%s increments by %s, not ids.block %d, reserving blocks of %s"%(name, increment, self.increment, increment))
+        return int(increment)
+
+
+class IdAllocator:
+    """ hands out the ids of each table from blocks of blockSize, a bulk insert larger than a
+        block reserves it all at once, ids of a rolled back insert are not reused, a forked
+        process starts over with blocks of its own
+    """
+
+    def __init__(self, source=None, blockSize=100, engine=None):
+        self.source    = source or TableSource()
+        self.blockSize = int(blockSize)
+        self.engine    = engine
+        self.blocks    = { }
+        self.lock      = threading.Lock()
+        self.pid       = os.getpid()
+        self.reserved  = 0
+
+    def configure(self, engine=None, source='auto', blockSize=100):
+        """ the sequence source where the engine's backend has sequences, the table source otherwise """
+        if source == 'auto':
+            source = engine.dialect.supports_sequences and 'sequence' or 'table'
+        self.lock.acquire()
+        try:
+            self.engine    = engine
+            self.blockSize = int(blockSize)
+            self.source    = source == 'sequence' and SequenceSource(self.blockSize) or TableSource()
+            self.blocks    = { }
+        finally:
+            self.lock.release()
+        return self
+
+    def nextId(self, cls):
+        """ the next id of a mapped class """
+        return self.nextIds(cls, 1)[0]
+
+    def nextIds(self, cls, count=1):
+        """ count ids of a mapped class, reserving as few blocks as it takes """
+        table = cls.__table__
+        ids   = [ ]
+        self.lock.acquire()
+        try:
+            if self.pid != os.getpid():
+                self.blocks = { }
+                self.pid    = os.getpid()
+            while len(ids) < count:
+                block = self.blocks.get(table.name)
+                if not block or block[0] >= block[1]:
+                    start, size = self._reserve(table, max(self.blockSize, count - len(ids)))
+                    block = self.blocks[table.name] = [ start, start + size ]
+                take = min(count - len(ids), block[1] - block[0])
+                ids.extend(range(block[0], block[0] + take))
+                block[0] += take
+        finally:
+            self.lock.release()
+        return ids
+
+    def getMetrics(self):
+        return { 'reserved': self.reserved, 'tables': len(self.blocks) }
+
+    def _reserve(self, table, size):
+        """ on a connection of its own, so the block is kept when the caller's session rolls back """
+        connection = (self.engine or meta.engine).connect()
+        try:
+            start, size = self.source.reserve(connection, table, size)
+        finally:
+            connection.close()
+        self.reserved += 1
+        log.debug("Reserved ids %d to %d of %s"%(start, start + size - 1, table.name))
+        return start, size
+
+
+def getIdColumn(table):
+    return list(table.primary_key.columns)[0]
+
+
+ALLOCATOR = IdAllocator()
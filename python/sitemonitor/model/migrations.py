@@ -0,0 +1,101 @@
+"""The Schema Migrations API
+
+Provides the versioned migrations of the schema that create_all cannot
+apply to an existing database, and migrate(), which websetup runs to
+apply the ones the database has not had yet. Every migration checks
+before it changes anything, so running them again is harmless.
+"""
+import logging
+import datetime as date
+
+from sqlalchemy import Table, Column, Integer, String, DateTime, select, func
+from sqlalchemy.engine.reflection import Inspector
+
+from sitemonitor.model import meta, LOOKUP_INDEXES
+
+log = logging.getLogger(__name__)
+
+schemaVersion = Table('SCHEMA_VERSION', meta.metadata,
+            Column('VERSION_ID', Integer, primary_key=True, autoincrement=False),
+            Column('DESCRIPTION', String(255), nullable=False),
+            Column('APPLIED_DATE', DateTime, nullable=False)
+        )
+"""
+    DROP TABLE SCHEMA_VERSION;
+    CREATE TABLE SCHEMA_VERSION (
+        VERSION_ID    NUMBER(38) NOT NULL,
+        DESCRIPTION   VARCHAR2(255) NOT NULL,
+        APPLIED_DATE  DATE NOT NULL,
+        CONSTRAINT PK_SCHEMA_VERSION PRIMARY KEY (VERSION_ID)
+    );
+
+    SELECT * FROM SCHEMA_VERSION;
+"""
+
+MIGRATIONS = [ ]
+
+def migration(version, description):
+    """ registers the decorated function, called with a connection, as a version of the schema """
+    def register(function):
+        MIGRATIONS.append((version, description, function))
+        MIGRATIONS.sort()
+        return function
+    return register
+
+
+@migration(1, 'index SITE(COUNTRY_CODE, END_POINT), HOST(VIP_NAME), HOST(HOST_NAME, HOST_PORT) and PREFERENCE(SITE_ID)')
+def addLookupIndexes(connection):
+    inspector = Inspector.from_engine(connection)
+    for index in LOOKUP_INDEXES:
+        existing = [ found['name'].upper() for found in inspector.get_indexes(index.table.name) if found['name'] ]
+        if index.name.upper() in existing:
+            continue
+        log.info("Creating index %s"%index.name)
+        index.create(bind=connection)
+
+
+def getVersion(connection):
+    """ the last version applied, 0 for a schema that has had none """
+    return connection.execute(select([func.max(schemaVersion.c.VERSION_ID)])).scalar() or 0
+
+
+def migrate(engine=None):
+    """ apply each migration newer than the schema's version, in order, returns the versions applied """
+    engine     = engine or meta.engine
+    applied    = [ ]
+    connection = engine.connect()
+    try:
+        schemaVersion.create(bind=connection, checkfirst=True)
+        current = getVersion(connection)
+        for version, description, function in MIGRATIONS:
+            if version <= current:
+                continue
+            log.info("Migrating the schema to version %d: %s"%(version, description))
+            transaction = connection.begin()
+            try:
+                function(connection)
+                connection.execute(schemaVersion.insert().values(
+                    VERSION_ID=version, DESCRIPTION=description, APPLIED_DATE=date.datetime.now()))
+                transaction.commit()
+            except:
+                transaction.rollback()
+                raise
+            applied.append(version)
+    finally:
+        connection.close()
+    return applied
+
+
+def getQueryPlan(query, connection=None):
+    """ the SQLite EXPLAIN QUERY PLAN details of an ORM query, to check it uses an index """
+    compiled = query.statement.compile(dialect=meta.engine.dialect)
+    params   = [ compiled.params[name] for name in compiled.positiontup ]
+    bind     = connection or meta.engine.connect()
+    try:
+        """ EXPLAIN does not read the database, a pooled connection would plan with the schema it last read """
+        bind.execute('SELECT COUNT(*) FROM sqlite_master').scalar()
+        rows = bind.execute('EXPLAIN QUERY PLAN ' + str(compiled), *params).fetchall()
+    finally:
+        if not connection:
+            bind.close()
+    return [ row['detail'] for row in rows ]
@@ -41,6 +41,7 @@ $(document).ready(
 				}
 			}
 		);
+		if ($('#siteId').length) followEvents();
 	}
 );
 
@@ -372,7 +373,8 @@ function updatePage(data) {
 	cancelFormDetails(data['form']);
 	path  = '/admin/index';
 	path += '/limit/' + ($('#limit').val() ? $('#limit').val() : '10');
-	path += '/offset/' + ($('#offset').val() ? $('#offset').val() : '0');
+	path += '/' + ($('#offsetText').val() ? $('#offsetText').val() : 'after');
+	path += '/' + ($('#offset').val() ? $('#offset').val() : '0');
 	setTimeout(function(){ top.location.href = path }, 1200);
 }
 
@@ -456,3 +458,61 @@ function restoreOrderOld(col) {
 	}
 }
 
+
+
+/* Status Events */
+function followEvents() {
+	if (window.EventSource) {
+		var source = new EventSource('/monitor/events');
+		source.addEventListener('host', function(e) { patchHost($.parseJSON(e.data)); }, false);
+		source.addEventListener('site', function(e) { patchSite($.parseJSON(e.data)); }, false);
+		source.addEventListener('reset', function(e) { document.location.reload(); }, false);
+	} else {
+		pollEvents('');
+	}
+}
+
+function pollEvents(since) {
+	$.ajax(
+		{
+			url: '/monitor/events',
+			data: { poll: 1, since: since },
+			dataType: 'json',
+			success: function(data) {
+				for (var i = 0; i < data.events.length; i++) {
+					var event = data.events[i];
+					if (event.type == 'host') patchHost(event);
+					if (event.type == 'site') patchSite(event);
+					if (event.type == 'reset') document.location.reload();
+				}
+				if (data.retry) {
+					setTimeout(function(){ pollEvents(data.since) }, data.retry * 1000);
+				} else {
+					pollEvents(data.since);
+				}
+			},
+			error: function() {
+				setTimeout(function(){ pollEvents(since) }, 5000);
+			}
+		}
+	);
+}
+
+function patchHost(event) {
+	$('iframe.iframe').each(function(){
+		var status = $(this).contents().find('#host_' + event.id + ' span.status');
+		if (!status.length) return;
+		if (event.status == 1) {
+			status.html('OK').css('color', 'green');
+		} else {
+			status.html('NOT OK').css('color', 'red');
+		}
+	});
+}
+
+function patchSite(event) {
+	if (event.id != $('#siteId').val()) return;
+	var header = $('#healthcheck div.itemHeader');
+	if (!header.find('span.count').length) header.find('span').after(' <span class="count"></span>');
+	header.find('span.count').html('(' + event.ok + '/' + event.total + ' OK)');
+}
@@ -13,11 +13,14 @@ from paste.deploy import loadapp
 from paste.script.appinstall import SetupCommand
 from pylons import config, url
 from routes.util import URLGenerator
+from sqlalchemy import event
 from webtest import TestApp
 
 import pylons.test
 
-__all__ = ['environ', 'url', 'TestController']
+from sitemonitor.model import meta
+
+__all__ = ['environ', 'url', 'TestController', 'StatementLog', 'StubHost']
 
 # Invoke websetup with the current config file
 SetupCommand('setup-app').run([pylons.test.pylonsapp.config['__file__']])
@@ -32,3 +35,37 @@ class TestController(TestCase):
         self.app = TestApp(wsgiapp)
         url._push_object(URLGenerator(config['routes.map'], environ))
         TestCase.__init__(self, *args, **kwargs)
+
+
+class StatementLog:
+    """ the statements the engine runs between start and stop, only those match returns true for if given """
+
+    def __init__(self, match=None, engine=None):
+        self.match      = match
+        self.engine     = engine or meta.engine
+        self.statements = [ ]
+
+    def start(self):
+        """ with retval the listener is registered as is, not wrapped, so stop can remove it """
+        event.listen(self.engine, 'before_cursor_execute', self.count, retval=True)
+        return self
+
+    def stop(self):
+        self.engine.dispatch.before_cursor_execute.remove(self.count, self.engine)
+
+    def count(self, connection, cursor, statement, parameters, context, executemany):
+        if not self.match or self.match(statement):
+            self.statements.append(statement)
+        return statement, parameters
+
+
+class StubHost(object):
+    """ a host row as the health check reads it """
+    healthCheck = ''
+
+    def __init__(self, id, name, port, vip=None, ip=None):
+        self.id   = id
+        self.name = name
+        self.port = port
+        self.vip  = vip
+        self.ip   = ip
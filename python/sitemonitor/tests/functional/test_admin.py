@@ -0,0 +1,57 @@
+import datetime as date
+import simplejson as json
+
+import pylons.test
+
+from sitemonitor.model import Site, meta
+from sitemonitor.tests import *
+
+IDS = range(950, 955)
+
+class TestAdminController(TestController):
+
+    def setUp(self):
+        for id in IDS:
+            site = Site()
+            site.id          = id
+            site.name        = 'Page Test %d'%id
+            site.endPoint    = 'pagetest%d'%id
+            site.countryCode = 'ZZ'
+            site.createdDate = date.datetime.today()
+            meta.Session.add(site)
+        meta.Session.commit()
+        meta.Session.remove()
+        pylons.test.pylonsapp.config['pylons.app_globals'].siteVersion.bump()
+
+    def tearDown(self):
+        meta.Session.query(Site).filter(Site.id.in_(IDS)).delete(synchronize_session=False)
+        meta.Session.commit()
+        meta.Session.remove()
+        pylons.test.pylonsapp.config['pylons.app_globals'].siteVersion.bump()
+
+    def test_site_pages(self):
+        """ the json sites page after a site id and point at the next page """
+        result = json.loads(self.app.get(url(controller='admin', action='site'), params={ 'limit': 2, 'after': 949 }).body)
+        assert [ site['id'] for site in result['sites'] ] == [ 950, 951 ]
+        assert result['next'] == 951
+        assert result['total'] >= len(IDS)
+        result = json.loads(self.app.get(url(controller='admin', action='site'), params={ 'limit': 2, 'after': result['next'] }).body)
+        assert [ site['id'] for site in result['sites'] ] == [ 952, 953 ]
+
+    def test_index_pages(self):
+        response = self.app.get('/admin/index/limit/2/after/951')
+        assert 'Page Test 952' in response.body
+        assert 'Page Test 954' not in response.body
+        assert '/admin/index/limit/2/after/953' in response.body
+        assert '/admin/index/limit/2/before/952' in response.body
+        response = self.app.get('/admin/index/limit/2/before/952')
+        assert 'Page Test 950' in response.body
+        assert 'Page Test 951' in response.body
+        assert '/admin/index/limit/2/after/951' in response.body
+
+    def test_page(self):
+        sites, more = Site().getPage(2, before=951)
+        assert [ site.id for site in sites ][-1] == 950
+        sites, more = Site().getPage(10, after=953)
+        assert sites[0].id == 954
+        meta.Session.remove()
@@ -0,0 +1,257 @@
+import time
+import socket
+import threading
+import datetime as date
+import simplejson as json
+
+import pylons.test
+
+from paste import httpserver
+from sqlalchemy.exc import InvalidRequestError
+from webob.multidict import MultiDict
+
+import sitemonitor.model as model
+
+from sitemonitor.lib.healthcheck import newResult
+from sitemonitor.model import Site, Host, meta
+from sitemonitor.tests import *
+
+class TestMonitorController(TestController):
+
+    def setUp(self):
+        site = Site()
+        site.id          = 900
+        site.name        = 'Status Test'
+        site.endPoint    = 'statustest'
+        site.countryCode = 'ZZ'
+        site.createdDate = date.datetime.today()
+        for id in (901, 902):
+            host = Host()
+            host.id     = id
+            host.name   = 'host%d.test'%id
+            host.ip     = '127.0.0.1'
+            host.port   = 8080
+            host.vip    = 'VIP-ZZ-%d'%id
+            host.status = 1
+            site.hosts.append(host)
+        meta.Session.add(site)
+        meta.Session.commit()
+        meta.Session.remove()
+        self.globals = pylons.test.pylonsapp.config['pylons.app_globals']
+        self.globals.siteVersion.bump()
+        self.status  = self.globals.status
+        result       = newResult('host901.test', 8080)
+        result.update({ 'status': 1, 'response': 200, 'latency': 0.01 })
+        self.status.update({ 901: result })
+
+    def tearDown(self):
+        site = Site().getById(900)
+        for host in site.hosts:
+            meta.Session.delete(host)
+        meta.Session.delete(site)
+        meta.Session.commit()
+        meta.Session.remove()
+        self.globals.siteVersion.bump()
+        self.status.results.clear()
+        self.status.histograms.clear()
+
+    def test_status(self):
+        response = self.app.get(url(controller='monitor', action='status', id='ZZ'))
+        sites    = json.loads(response.body)['sites']
+        assert len(sites) == 1
+        assert sites[0]['endPoint'] == 'ZZ/statustest'
+        assert sites[0]['total'] == 2
+        assert sites[0]['ok'] == 1
+        assert [ host['status'] for host in sites[0]['hosts'] ] == [ 1, None ]
+
+    def test_status_vip(self):
+        response = self.app.get(url(controller='monitor', action='status'), params={ 'vip': 'VIP-ZZ-902' })
+        sites    = json.loads(response.body)['sites']
+        assert len(sites) == 1
+        assert [ host['id'] for host in sites[0]['hosts'] ] == [ 902 ]
+
+    def test_events_poll(self):
+        since    = self.status.getSequence()
+        self.status.update({ 902: { 'status': 0, 'latency': None, 'checked': time.time(), 'error': 'refused' } })
+        response = self.app.get(url(controller='monitor', action='events'), params={ 'poll': 1, 'since': since })
+        data     = json.loads(response.body)
+        assert data['since'] == since + 1
+        assert data['events'][0]['type'] == 'host'
+        assert data['events'][0]['id'] == 902
+
+    def test_events_busy(self):
+        """ with every stream taken a long-poll is told to retry instead of holding a worker """
+        taken = [ ]
+        while self.globals.followers.acquire(False):
+            taken.append(1)
+        try:
+            started  = time.time()
+            response = self.app.get(url(controller='monitor', action='events'), params={ 'poll': 1, 'since': 1 })
+            data     = json.loads(response.body)
+            assert data['events'] == [ ] and data['retry'] == 10
+            assert time.time() - started < 1
+        finally:
+            for slot in taken:
+                self.globals.followers.release()
+        assert len(taken) == 4
+
+    def test_events_stream(self):
+        """ read from a real server, past the debug error handler and after the request's registry
+            is gone, an event shows up as it happens and the slot is back once the stream ends
+        """
+        server = httpserver.serve(pylons.test.pylonsapp, host='127.0.0.1', port=0, start_loop=False, use_threadpool=False, daemon_threads=True)
+        thread = threading.Thread(target=server.handle_request)
+        thread.setDaemon(True)
+        thread.start()
+        config = pylons.test.pylonsapp.config
+        config['healthcheck.events.duration'] = 2
+        try:
+            """ urllib2 reads in 8k blocks, a socket gets each chunk as it is written """
+            stream   = socket.create_connection(('127.0.0.1', server.server_port), 5)
+            received = [ '' ]
+            def readUntil(text, start=0):
+                while text not in received[0][start:]:
+                    chunk = stream.recv(4096)
+                    assert chunk, received[0]
+                    received[0] += chunk
+                return received[0].index(text, start)
+            stream.sendall('GET %s HTTP/1.0\r\n\r\n'%url(controller='monitor', action='events'))
+            readUntil('retry: 1000')
+            assert 'Content-Type: text/event-stream' in received[0]
+            started = time.time()
+            self.status.update({ 902: { 'status': 0, 'latency': None, 'checked': time.time(), 'error': 'refused' } })
+            data = readUntil('data: ') + 6
+            assert time.time() - started < 1, time.time() - started
+            assert json.loads(received[0][data:readUntil('\n', data)])['id'] == 902
+            while stream.recv(4096):
+                pass
+            stream.close()
+        finally:
+            config['healthcheck.events.duration'] = 20
+            server.server_close()
+        taken = 0
+        while self.globals.followers.acquire(False):
+            taken += 1
+        for slot in range(taken):
+            self.globals.followers.release()
+        assert taken == 4
+
+    def test_events_bad_since(self):
+        response = self.app.get(url(controller='monitor', action='events'), params={ 'poll': 1, 'since': 'abc' })
+        assert 'events' in json.loads(response.body)
+        response = self.app.get(url(controller='monitor', action='events'), params={ 'poll': 1 }, headers={ 'Last-Event-ID': 'x' })
+        assert 'events' in json.loads(response.body)
+
+    def test_status_etag(self):
+        response = self.app.get(url(controller='monitor', action='status', id='ZZ'))
+        etag     = response.headers['ETag']
+        response = self.app.get(url(controller='monitor', action='status', id='ZZ'), headers={ 'If-None-Match': etag }, status=304)
+        assert not response.body
+        self.status.update({ 902: { 'status': 1, 'latency': 0.01, 'checked': time.time(), 'error': None } })
+        response = self.app.get(url(controller='monitor', action='status', id='ZZ'), headers={ 'If-None-Match': etag })
+        assert response.headers['ETag'] != etag
+        """ a change to the site configuration also invalidates it """
+        etag = response.headers['ETag']
+        self.globals.siteVersion.bump()
+        self.app.get(url(controller='monitor', action='status', id='ZZ'), headers={ 'If-None-Match': etag }, status=200)
+
+    def test_panel_etag_reload(self):
+        """ a site edited by another process shows up once the site registry reloads it """
+        panel    = url(controller='monitor', action='splunk', country='ZZ', name='statustest')
+        etag     = self.app.get(panel).headers['ETag']
+        self.app.get(panel, headers={ 'If-None-Match': etag }, status=304)
+        meta.engine.execute("UPDATE SITE SET SITE_NAME = 'Renamed' WHERE SITE_ID = 900")
+        self.globals.sites.loadedAt = 0
+        response = self.app.get(panel, headers={ 'If-None-Match': etag }, status=200)
+        assert response.headers['ETag'] != etag
+
+    def test_panel_etag_other_hosts(self):
+        """ a probe of a host on another site leaves the panel and the country status ETags alone """
+        panel  = url(controller='monitor', action='healthcheck', country='ZZ', name='statustest')
+        status = url(controller='monitor', action='status', id='ZZ')
+        self.status.update({ 902: newResult('host902.test', 8080, 'refused') })
+        etags  = [ self.app.get(page).headers['ETag'] for page in (panel, status) ]
+        self.status.update({ 999001: newResult('other.test', 8080, 'refused') })
+        for page, etag in zip((panel, status), etags):
+            self.app.get(page, headers={ 'If-None-Match': etag }, status=304)
+        self.status.update({ 901: newResult('host901.test', 8080, 'refused') })
+        for page, etag in zip((panel, status), etags):
+            self.app.get(page, headers={ 'If-None-Match': etag }, status=200)
+
+    def test_site_etag_host_status(self):
+        """ the collector updating a host's status changes the admin site json's ETag """
+        site     = url(controller='admin', action='site', id=900)
+        etag     = self.app.get(site).headers['ETag']
+        self.app.get(site, headers={ 'If-None-Match': etag }, status=304)
+        meta.engine.execute("UPDATE HOST SET STATUS = 0 WHERE HOST_ID = 902")
+        response = self.app.get(site, headers={ 'If-None-Match': etag }, status=200)
+        assert response.headers['ETag'] != etag
+
+    def test_host_latency(self):
+        response = self.app.get(url(controller='admin', action='host', country='ZZ', name='VIP-ZZ-901'))
+        hosts    = json.loads(response.body)['hosts']
+        assert hosts[0]['latency']['count'] == 1
+        assert 0.009 <= hosts[0]['latency']['p99'] <= 0.011
+        assert hosts[0].has_key('uptime')
+
+    def test_site_summaries(self):
+        """ the site dropdown is one row per site and never touches the hosts """
+        log = StatementLog().start()
+        try:
+            summaries = Site().getSummaries()
+        finally:
+            log.stop()
+        assert len(log.statements) == 1
+        assert 'HOST' not in log.statements[0]
+        assert [ summary.getEndPoint() for summary in summaries if summary.id == 900 ] == [ 'ZZ/statustest' ]
+        response = self.app.get('/monitor/index/ZZ/statustest')
+        assert 'value="ZZ/statustest"' in response.body
+
+    def test_site_load(self):
+        site = Site().getById(900, load=('hosts', ))
+        assert 'hosts' in site.__dict__
+        assert 'monitors' not in site.__dict__
+        meta.Session.remove()
+
+    def test_site_registry(self):
+        """ the panels resolve their site without a query once the registry is loaded """
+        self.app.get('/monitor/keynote/ZZ/statustest')
+        log = StatementLog().start()
+        try:
+            self.app.get('/monitor/keynote/ZZ/statustest')
+            response = self.app.get('/monitor/healthcheck/ZZ/statustest')
+        finally:
+            log.stop()
+        assert 'SITE' not in ' '.join(log.statements)
+        assert response.body.index('host901.test') < response.body.index('host902.test')
+        self.app.get('/monitor/keynote/ZZ/missing', status=404)
+        """ a change to the sites shows up after the version is bumped """
+        site = Site().getById(900)
+        site.endPoint = 'renamed'
+        meta.Session.commit()
+        meta.Session.remove()
+        self.app.get('/monitor/keynote/ZZ/statustest')
+        self.globals.siteVersion.bump()
+        self.app.get('/monitor/keynote/ZZ/renamed')
+        self.app.get('/monitor/keynote/ZZ/statustest', status=404)
+
+    def test_set_host_data(self):
+        """ the submitted hosts load in one query per chunk, in the submitted order """
+        log   = StatementLog(lambda statement: 'IN (' in statement).start()
+        chunk = model.IN_CHUNK
+        model.IN_CHUNK = 1
+        try:
+            site  = Site().getById(900)
+            hosts = site.setHostData(MultiDict([ ('site_host', '902'), ('site_host', '901') ]))
+        finally:
+            model.IN_CHUNK = chunk
+            log.stop()
+        assert [ host.id for host in hosts ] == [ 902, 901 ]
+        assert len(log.statements) == 2
+        try:
+            site.setHostData(MultiDict([ ('site_host', '901'), ('site_host', '99901'), ('site_host', '99902') ]))
+            assert False
+        except InvalidRequestError, e:
+            assert str(e) == 'No Host with id 99901, 99902'
+        meta.Session.rollback()
+        meta.Session.remove()
@@ -0,0 +1,46 @@
+import pylons.test
+
+from unittest import TestCase
+from webtest import TestApp
+
+from sitemonitor.lib.benchmark import benchmarkHealthCheck, benchmarkPool, parseMix
+from sitemonitor.lib.healthcheck import probe
+from sitemonitor.lib.stubs import newStub
+from sitemonitor.tests import *
+
+class TestBenchmark(TestCase):
+    """The unit tests for the stub backends and the health check benchmark."""
+
+    def testStubs(self):
+        flap  = newStub('flap')
+        large = newStub('large')
+        try:
+            assert [ probe('127.0.0.1', flap.port)['status'] for i in range(4) ] == [ 1, 0, 1, 0 ]
+            result = probe('127.0.0.1', large.port)
+            assert result['status'] == 0
+            assert result['bytesRead'] == 65536
+        finally:
+            flap.stop()
+            large.stop()
+
+    def testPool(self):
+        """ both sides run the whole probe, only the pooled one reuses its connection """
+        result = benchmarkPool(20)
+        assert result['connections'] == { 'fresh': 20, 'pooled': 1 }
+        assert result['fresh'] > 0 and result['pooled'] > 0
+
+    def testMix(self):
+        assert parseMix('fast=3,slow=1', 8) == [ 'fast' ] * 6 + [ 'slow' ] * 2
+        assert len(parseMix('fast=1,hang=1', 3)) == 3
+        self.assertRaises(ValueError, parseMix, 'quick=1', 2)
+
+    def testHealthCheck(self):
+        report = benchmarkHealthCheck(TestApp(pylons.test.pylonsapp), hosts=6, sites=2, mix='fast=4,flap=2', rounds=2)
+        assert len(report['rounds']) == 2
+        for result in report['rounds']:
+            assert result['probes'] == 6
+            assert len(result['panels']) == 2
+            assert result['modes']['fast'] == { 'ok': 4, 'failed': 0 }
+        assert report['rounds'][0]['modes']['flap'] == { 'ok': 2, 'failed': 0 }
+        assert report['rounds'][1]['modes']['flap'] == { 'ok': 0, 'failed': 2 }
+        assert report['summary']['latencyP50'] is not None
@@ -0,0 +1,51 @@
+import time
+
+from unittest import TestCase
+
+from sitemonitor.lib.breaker import Breaker, OPEN, CLOSED
+from sitemonitor.lib.healthcheck import HealthCheck
+from sitemonitor.lib.stubs import StubServer
+
+KEY = ('127.0.0.1', 80)
+
+class TestBreaker(TestCase):
+    """The unit tests for adaptive probe timeouts and the circuit breaker."""
+
+    def testTimeout(self):
+        breaker = Breaker(minTimeout=0.1, maxTimeout=2, margin=0.05, samples=20)
+        assert breaker.getTimeout(KEY) == 2
+        for i in range(20):
+            breaker.success(KEY, 0.2)
+        assert abs(breaker.getTimeout(KEY) - 0.25) < 0.001
+        for i in range(20):
+            breaker.success(KEY, 0.001)
+        assert breaker.getTimeout(KEY) == 0.1
+
+    def testBackoff(self):
+        breaker = Breaker(failures=2, backoff=0.1)
+        breaker.failure(KEY)
+        assert breaker.allow(KEY)
+        breaker.failure(KEY)
+        assert breaker.getState(KEY).state == OPEN
+        assert not breaker.allow(KEY)
+        time.sleep(0.15)
+        """ the trial probe fails, so the backoff doubles """
+        assert breaker.allow(KEY)
+        assert not breaker.allow(KEY)
+        breaker.failure(KEY)
+        assert breaker.getState(KEY).backoff == 0.2
+        time.sleep(0.25)
+        assert breaker.allow(KEY)
+        breaker.success(KEY)
+        assert breaker.getState(KEY).state == CLOSED
+
+    def testDeadHost(self):
+        server = StubServer()
+        port   = server.port
+        server.server_close()
+        check  = HealthCheck(breaker=Breaker(failures=2, backoff=60))
+        for i in range(2):
+            assert check.check('127.0.0.1', port)['error'] != 'circuit open'
+        result = check.check('127.0.0.1', port)
+        assert result['error'] == 'circuit open'
+        assert result['status'] == 0
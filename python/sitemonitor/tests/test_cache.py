@@ -0,0 +1,94 @@
+import time
+
+from unittest import TestCase
+
+from sitemonitor.lib.cache import Preferences, SiteRegistry, Version
+from sitemonitor.model import Preference, meta
+from sitemonitor.tests import *
+
+SITE_ID = 9101
+
+class TestCache(TestCase):
+    """The unit tests for the versions, the preferences cache and the site registry."""
+
+    def tearDown(self):
+        meta.Session.query(Preference).filter_by(siteId=SITE_ID).delete()
+        meta.Session.commit()
+        meta.Session.remove()
+
+    def testVersion(self):
+        version = Version(5)
+        assert version.bump() == 6
+        assert version.get() == 6
+
+    def testPreferences(self):
+        loads = [ ]
+        def loader(siteId):
+            loads.append(siteId)
+            return siteId == 1 and { 'col1': [ 'splunk' ] } or None
+        cache = Preferences(loader)
+        assert cache.get(1) == { 'col1': [ 'splunk' ] }
+        assert cache.get('1') == { 'col1': [ 'splunk' ] }
+        assert cache.get(2) is None
+        assert cache.get(2) is None
+        assert loads == [ 1, 2 ]
+        cache.invalidate(1)
+        cache.get(1)
+        assert loads == [ 1, 2, 1 ]
+
+    def testPreferencesMaxAge(self):
+        """ a site saved by another process shows up once its entry is maxAge seconds old """
+        loads = [ ]
+        def loader(siteId):
+            loads.append(siteId)
+            return len(loads)
+        cache = Preferences(loader, maxAge=60)
+        assert cache.get(1) == 1
+        assert cache.get(1) == 1
+        cache.entries[1] = (1, time.time() - 61)
+        assert cache.get(1) == 2
+        assert cache.getMetrics() == { 'hits': 1, 'loads': 2, 'sites': 1 }
+
+    def testInvalidatedWhileLoading(self):
+        cache = Preferences()
+        def loader(siteId):
+            cache.invalidate(siteId)
+            return 'stale'
+        cache.loader = loader
+        assert cache.get(1) == 'stale'
+        assert not cache.entries.has_key(1)
+
+    def testSave(self):
+        """ saving decodes the new json on the next read, and eval is never used on it """
+        Preference().save(SITE_ID, '{"site": "%d", "col1": ["healthcheck"], "col2": []}'%SITE_ID)
+        assert Preference().getDataBySiteId(SITE_ID)['col1'] == [ 'healthcheck' ]
+        Preference().save(SITE_ID, '{"site": "%d", "col1": [], "col2": ["healthcheck"]}'%SITE_ID)
+        assert Preference().getDataBySiteId(SITE_ID)['col2'] == [ 'healthcheck' ]
+        Preference().save(SITE_ID, '__import__("os").getcwd()')
+        assert Preference().getDataBySiteId(SITE_ID) is None
+
+    def testSiteRegistry(self):
+        loads   = [ ]
+        def loader():
+            loads.append(1)
+            return { ('US', 'publisher'): 'snapshot %d'%len(loads) }
+        version  = Version(1)
+        registry = SiteRegistry(loader, version)
+        assert registry.get('US', 'publisher') == 'snapshot 1'
+        assert registry.get('GB', 'publisher') is None
+        assert len(loads) == 1
+        version.bump()
+        assert registry.get('US', 'publisher') == 'snapshot 2'
+        registry.maxAge = 0
+        assert registry.get('US', 'publisher') == 'snapshot 3'
+
+    def testSiteRegistryVersion(self):
+        """ a reload that finds the same snapshots keeps the version, a changed one moves it on """
+        snapshots = { ('US', 'publisher'): 'snapshot' }
+        registry  = SiteRegistry(lambda: dict(snapshots), Version(1))
+        first     = registry.getVersion()
+        registry.loadedAt = 0
+        assert registry.getVersion() == first
+        snapshots[('US', 'publisher')] = 'edited by another process'
+        registry.loadedAt = 0
+        assert registry.getVersion() != first
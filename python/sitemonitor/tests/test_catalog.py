@@ -0,0 +1,63 @@
+from collections import namedtuple
+from unittest import TestCase
+
+from sitemonitor.lib.cache import Version
+from sitemonitor.lib.catalog import VipCatalog
+from sitemonitor.lib.healthcheck import StatusStore
+from sitemonitor.tests import *
+
+Row = namedtuple('Row', 'id name ip port vip status siteId')
+
+class TestCatalog(TestCase):
+    """The unit tests for the VIP catalog."""
+
+    def setUp(self):
+        self.rows = [
+            Row(2, 'b.test', '10.0.0.2', 80, 'VIP-A', 1, 1),
+            Row(1, 'a.test', '10.0.0.1', 80, 'VIP-A', 1, 1),
+            Row(1, 'a.test', '10.0.0.1', 80, 'VIP-A', 1, 2),
+            Row(3, 'c.test', '10.0.0.3', 80, 'VIP-B', 0, None),
+            Row(4, 'd.test', '10.0.0.4', 80, None, 1, 1),
+        ]
+
+    def testSync(self):
+        catalog = VipCatalog()
+        catalog.sync(self.rows)
+        assert catalog.getVips() == [ 'VIP-A', 'VIP-B' ]
+        assert [ member.id for member in catalog.getMembers('VIP-A') ] == [ 1, 2 ]
+        assert catalog.getMembers('VIP-A')[0].ip == '10.0.0.1'
+        assert catalog.getMembers('VIP-C') == ( )
+        assert catalog.getCounts('VIP-A') == { 'members': 2, 'healthy': 0 }
+
+    def testHealthy(self):
+        """ the status store keeps the healthy counts current, across syncs """
+        catalog = VipCatalog()
+        store   = StatusStore()
+        store.addListener(catalog.setStatus)
+        catalog.sync(self.rows)
+        store.update({ 1: { 'status': 1, 'checked': 0 }, 2: { 'status': 1, 'checked': 0 }, 3: { 'status': 0, 'checked': 0 } })
+        assert catalog.getCounts('VIP-A')['healthy'] == 2
+        store.update({ 2: { 'status': 0, 'checked': 0 } })
+        store.update({ 2: { 'status': 0, 'checked': 0 } })
+        assert catalog.getCounts('VIP-A')['healthy'] == 1
+        assert catalog.getCounts('VIP-B')['healthy'] == 0
+        catalog.sync(self.rows[1:])
+        assert catalog.getCounts('VIP-A') == { 'members': 1, 'healthy': 1 }
+
+    def testLoader(self):
+        """ without a sync the loader fills it, again once the version moves on """
+        loads   = [ ]
+        def loader():
+            loads.append(1)
+            return self.rows
+        version = Version(1)
+        catalog = VipCatalog(loader, version)
+        catalog.getVips()
+        catalog.getMembers('VIP-A')
+        assert len(loads) == 1
+        version.bump()
+        catalog.getVips()
+        assert len(loads) == 2
+        catalog.sync(self.rows)
+        catalog.getVips()
+        assert len(loads) == 2
@@ -0,0 +1,59 @@
+import time
+
+from unittest import TestCase
+
+from sitemonitor.lib.connectionpool import ConnectionPool, PoolTimeout
+from sitemonitor.lib.healthcheck import probe
+from sitemonitor.lib.stubs import StubServer
+
+class TestConnectionPool(TestCase):
+    """The unit tests for the keep-alive health check connection pool."""
+
+    def tearDown(self):
+        self.server.stop()
+
+    def testReuse(self):
+        self.server = StubServer().start()
+        pool = ConnectionPool()
+        for i in range(10):
+            assert probe('127.0.0.1', self.server.port, pool)['status'] == 1
+        assert self.server.requests == 10
+        assert self.server.connections == 1
+
+    def testReconnect(self):
+        self.server = StubServer(keepalive=False).start()
+        pool = ConnectionPool()
+        for i in range(3):
+            assert probe('127.0.0.1', self.server.port, pool)['status'] == 1
+        assert pool.reconnects == 2
+
+    def testNoRetryOnTimeout(self):
+        """ a slow host on a reused connection is asked once and takes one timeout """
+        self.server = StubServer().start()
+        pool = ConnectionPool()
+        assert probe('127.0.0.1', self.server.port, pool)['status'] == 1
+        self.server.delay = 0.5
+        start  = time.time()
+        result = probe('127.0.0.1', self.server.port, pool, timeout=0.2)
+        assert result['status'] == 0
+        assert time.time() - start < 0.4
+        assert self.server.requests == 2
+        assert pool.reconnects == 0
+
+    def testCap(self):
+        self.server = StubServer().start()
+        pool = ConnectionPool(maxPerHost=1, wait=0.1)
+        held = pool.urlopen('127.0.0.1', self.server.port, '/health-check')
+        self.assertRaises(PoolTimeout, pool.urlopen, '127.0.0.1', self.server.port, '/health-check')
+        held.read()
+        held.release()
+        assert probe('127.0.0.1', self.server.port, pool)['status'] == 1
+
+    def testIdle(self):
+        self.server = StubServer().start()
+        pool = ConnectionPool(maxIdle=0.1)
+        probe('127.0.0.1', self.server.port, pool)
+        time.sleep(0.2)
+        probe('127.0.0.1', self.server.port, pool)
+        assert self.server.connections == 2
+        assert pool.reconnects == 0
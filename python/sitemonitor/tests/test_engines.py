@@ -0,0 +1,152 @@
+import os
+import time
+import shutil
+import sqlite3
+import tempfile
+import threading
+import datetime as date
+
+from unittest import TestCase
+
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+
+from sitemonitor.model import Site
+from sitemonitor.model.engines import EngineRouter, RoutingSession, SqlitePragmas, newEngine
+
+class TestEngines(TestCase):
+    """The unit tests for the SQLite profile, readers must never wait on the collector's writes."""
+
+    def setUp(self):
+        self.dir    = tempfile.mkdtemp()
+        self.file   = os.path.join(self.dir, 'stress.db')
+        self.engine = newEngine({ 'sqlalchemy.url': 'sqlite:///%s'%self.file, 'sqlite.busy_timeout': 3000 })
+        self.engine.execute('CREATE TABLE HEALTH (ID INTEGER PRIMARY KEY, STATUS INTEGER)')
+        self.engine.execute('INSERT INTO HEALTH (ID, STATUS) VALUES (1, 1)')
+
+    def tearDown(self):
+        self.engine.dispose()
+        shutil.rmtree(self.dir)
+
+    def testProfile(self):
+        """ every pooled connection gets the pragmas """
+        assert isinstance(self.engine.pool, QueuePool)
+        assert self.engine.execute('PRAGMA journal_mode').scalar() == 'wal'
+        assert self.engine.execute('PRAGMA busy_timeout').scalar() == 3000
+        assert self.engine.execute('PRAGMA synchronous').scalar() == 1
+        assert self.engine.execute('PRAGMA cache_size').scalar() == -8000
+
+    def testNoProfile(self):
+        """ an in-memory database, or sqlite.profile = false, keeps the default engine """
+        engine = newEngine({ 'sqlalchemy.url': 'sqlite:///%s'%self.file, 'sqlite.profile': 'false' })
+        assert not isinstance(engine.pool, QueuePool)
+        assert engine.execute('PRAGMA busy_timeout').scalar() != 3000
+        engine = newEngine({ 'sqlalchemy.url': 'sqlite://' })
+        assert not isinstance(engine.pool, QueuePool)
+
+    def testBadPragma(self):
+        self.assertRaises(ValueError, SqlitePragmas, journalMode='wall')
+        self.assertRaises(ValueError, SqlitePragmas, synchronous='fast')
+
+    def testReadersDuringWrite(self):
+        """ the collector holds a write transaction, the worker threads still read, and a
+            writer of the app's waits for it rather than failing with database is locked
+        """
+        collector = sqlite3.connect(self.file, check_same_thread=False)
+        collector.execute('BEGIN IMMEDIATE')
+        collector.execute('INSERT INTO HEALTH (ID, STATUS) VALUES (2, 0)')
+        latencies = [ ]
+        errors    = [ ]
+        def read():
+            for count in range(20):
+                started = time.time()
+                try:
+                    assert self.engine.execute('SELECT COUNT(*) FROM HEALTH').scalar() == 1
+                except Exception, e:
+                    errors.append(e)
+                latencies.append(time.time() - started)
+        def write():
+            try:
+                self.engine.execute('INSERT INTO HEALTH (ID, STATUS) VALUES (3, 1)')
+            except Exception, e:
+                errors.append(e)
+        readers = [ threading.Thread(target=read) for count in range(8) ]
+        writer  = threading.Thread(target=write)
+        for thread in readers + [ writer ]:
+            thread.start()
+        for thread in readers:
+            thread.join()
+        time.sleep(0.5)
+        assert writer.isAlive()
+        collector.commit()
+        collector.close()
+        writer.join()
+        assert errors == [ ], errors
+        assert len(latencies) == 160
+        assert max(latencies) < 0.2, max(latencies)
+        assert self.engine.execute('SELECT COUNT(*) FROM HEALTH').scalar() == 3
+
+
+class TestRouting(TestCase):
+    """The unit tests for the routing session, a second SQLite file stands in for the replica."""
+
+    def setUp(self):
+        self.dir     = tempfile.mkdtemp()
+        self.primary = newEngine({ 'sqlalchemy.url': 'sqlite:///%s'%os.path.join(self.dir, 'primary.db') })
+        self.replica = newEngine({ 'sqlalchemy.url': 'sqlite:///%s'%os.path.join(self.dir, 'replica.db') })
+        for engine in (self.primary, self.replica):
+            Site.__table__.create(bind=engine)
+        self.router  = EngineRouter(self.primary, self.replica, sticky=60)
+        self.Session = sessionmaker(class_=RoutingSession, router=self.router)
+
+    def tearDown(self):
+        self.primary.dispose()
+        self.replica.dispose()
+        shutil.rmtree(self.dir)
+
+    def getNames(self, readOnly=True):
+        db = self.Session()
+        db.readOnly = readOnly
+        try:
+            return [ site.name for site in db.query(Site).all() ]
+        finally:
+            db.close()
+
+    def newSite(self, engine, name):
+        engine.execute(Site.__table__.insert().values(SITE_ID=1, SITE_NAME=name, END_POINT=name, COUNTRY_CODE='ZZ', CREATED_DATE=date.datetime.now()))
+
+    def testReads(self):
+        """ only the read-only queries go to the replica """
+        self.newSite(self.primary, 'primary')
+        self.newSite(self.replica, 'replica')
+        assert self.getNames() == [ 'replica' ]
+        assert self.getNames(False) == [ 'primary' ]
+        self.router.replica = None
+        assert self.getNames() == [ 'primary' ]
+
+    def testWrites(self):
+        """ a read-only session writes and commits to the primary, and reads its own writes """
+        db = self.Session()
+        db.readOnly = True
+        site = Site()
+        site.name, site.endPoint, site.countryCode, site.createdDate = 'saved', 'saved', 'ZZ', date.datetime.now()
+        site.id = 1
+        db.add(site)
+        db.flush()
+        assert [ found.name for found in db.query(Site).all() ] == [ 'saved' ]
+        db.commit()
+        db.close()
+        assert self.primary.execute('SELECT COUNT(*) FROM SITE').scalar() == 1
+        assert self.replica.execute('SELECT COUNT(*) FROM SITE').scalar() == 0
+
+    def testSticky(self):
+        """ reads stay on the primary for sticky seconds after a commit that wrote """
+        self.newSite(self.replica, 'replica')
+        db = self.Session()
+        db.execute(Site.__table__.insert().values(SITE_ID=2, SITE_NAME='saved', END_POINT='saved', COUNTRY_CODE='ZZ', CREATED_DATE=date.datetime.now()))
+        db.commit()
+        db.close()
+        assert self.getNames() == [ 'saved' ]
+        self.router.lastWrite -= 60
+        assert self.getNames() == [ 'replica' ]
+        assert self.router.getMetrics()['writes'] == 1
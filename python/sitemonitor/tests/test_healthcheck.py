@@ -0,0 +1,154 @@
+import time
+
+from StringIO import StringIO
+from unittest import TestCase
+
+from sitemonitor.lib.connectionpool import ConnectionPool
+from sitemonitor.lib.healthcheck import HealthCheck, Matcher, StatusStore, Scheduler, probe
+from sitemonitor.lib.stubs import StubServer
+from sitemonitor.tests import *
+
+class TestHealthCheck(TestCase):
+    """The unit tests for the concurrent health check fan-out."""
+
+    def setUp(self):
+        self.servers = [ StubServer(delay=0.5).start() for i in range(4) ]
+        self.hosts   = [ StubHost(i + 1, '127.0.0.1', s.port) for i, s in enumerate(self.servers) ]
+
+    def tearDown(self):
+        for server in self.servers:
+            server.stop()
+
+    def testParallel(self):
+        start   = time.time()
+        results = HealthCheck(threads=4, deadline=5).checkHosts(self.hosts)
+        elapsed = time.time() - start
+        assert elapsed < 1.5, elapsed
+        for host in self.hosts:
+            assert results[host.id]['status'] == 1
+            assert host.healthCheck == 1
+
+    def testDeadline(self):
+        results = HealthCheck(threads=4, deadline=0.1).checkHosts(self.hosts)
+        for host in self.hosts:
+            assert results[host.id]['error'] == 'deadline exceeded'
+            assert host.healthCheck == 0
+        """ let the abandoned probes finish before the servers go away """
+        time.sleep(0.6)
+
+
+class TestStatusStore(TestCase):
+    """The unit tests for the background scheduler and the status store."""
+
+    def setUp(self):
+        self.server = StubServer().start()
+        self.hosts  = [ StubHost(i + 1, '127.0.0.1', self.server.port) for i in range(3) ]
+
+    def tearDown(self):
+        self.server.stop()
+
+    def testScheduler(self):
+        store     = StatusStore(maxAge=60)
+        scheduler = Scheduler(HealthCheck(), store, lambda: self.hosts, interval=60)
+        scheduler.runOnce()
+        assert self.server.requests == 1
+        """ reading from a warm store does no network I/O """
+        results = store.checkHosts(self.hosts)
+        assert self.server.requests == 1
+        for host in self.hosts:
+            assert results[host.id]['status'] == 1
+            assert results[host.id]['latency'] is not None
+
+    def testDeduplication(self):
+        """ host 1 belongs to two sites and host 4 is another row for the same host:port """
+        references = self.hosts + self.hosts[:1] + [ StubHost(4, '127.0.0.1', self.server.port) ]
+        other      = StubServer().start()
+        try:
+            references.append(StubHost(5, '127.0.0.1', other.port))
+            store = StatusStore()
+            Scheduler(HealthCheck(), store, lambda: references).runOnce()
+        finally:
+            other.stop()
+        assert self.server.requests == 1
+        assert other.requests == 1
+        assert sorted(store.results.keys()) == [ 1, 2, 3, 4, 5 ]
+        metrics = store.getMetrics()
+        assert metrics['references'] == 6
+        assert metrics['probes'] == 2
+        assert metrics['saved'] == 4
+
+    def testLatency(self):
+        """ every probe that got a response counts once, republishing a result does not """
+        store = StatusStore()
+        for i in range(1, 101):
+            result = { 'status': 1, 'response': 200, 'latency': i / 1000.0, 'checked': time.time() }
+            store.update({ 1: result })
+            store.update({ 1: result })
+        store.update({ 1: { 'status': 0, 'response': None, 'latency': 2.0, 'checked': time.time() } })
+        latency = store.getLatency(1)
+        assert latency['count'] == 100
+        assert 0.045 <= latency['p50'] <= 0.056
+        assert 0.09 <= latency['p95'] <= 0.105
+        assert 0.094 <= latency['p99'] <= 0.11
+        assert store.getLatency(2) is None
+        assert store.getHistogram(1).merge(store.getHistogram(1)).total == 200
+
+    def testStale(self):
+        store = StatusStore(HealthCheck(), maxAge=60)
+        store.update({ 1: { 'status': 0, 'checked': time.time() - 120 } })
+        results = store.checkHosts(self.hosts[:1])
+        assert results[1]['status'] == 1
+        assert self.server.requests == 1
+
+    def testScheduled(self):
+        """ without a healthcheck, as with the scheduler on, missing and stale hosts stay unknown """
+        store = StatusStore(maxAge=60)
+        store.update({ 1: { 'status': 0, 'checked': time.time() - 120 } })
+        hosts = [ StubHost(1, '127.0.0.1', self.server.port), StubHost(2, '127.0.0.1', self.server.port) ]
+        assert store.checkHosts(hosts) == { }
+        assert [ host.healthCheck for host in hosts ] == [ '', '' ]
+        assert self.server.requests == 0
+
+    def testEvents(self):
+        """ only transitions are published, waiters wake up on them and a truncated log resets """
+        store = StatusStore(maxEvents=3)
+        assert store.waitEvents(0, 0.01) == [ ]
+        store.update({ 1: { 'status': 1, 'checked': time.time() } })
+        store.update({ 1: { 'status': 1, 'checked': time.time() } })
+        store.updateSites({ 10: [ 1, 2 ] })
+        events = store.waitEvents(0, 0.01)
+        assert [ event['type'] for event in events ] == [ 'host', 'site' ]
+        assert events[1]['ok'] == 1 and events[1]['total'] == 2
+        since = store.getSequence()
+        store.update({ 2: { 'status': 0, 'checked': time.time() }, 1: { 'status': 0, 'checked': time.time() } })
+        assert len(store.waitEvents(since, 0.01)) == 2
+        store.updateSites({ 10: [ 1, 2 ] })
+        assert store.waitEvents(since - 1, 0.01)[0]['type'] == 'reset'
+        """ a Last-Event-ID from before a restart is ahead of the log """
+        started = time.time()
+        assert store.waitEvents(store.getSequence() + 500, 1) == [ { 'type': 'reset', 'seq': store.getSequence() } ]
+        assert time.time() - started < 0.5
+
+
+class TestMatcher(TestCase):
+    """The unit tests for the streaming, bounded response matcher."""
+
+    def testSpanningChunks(self):
+        matcher = Matcher(chunkSize=10, overlap=8)
+        body    = 'x' * 25 + 'SCALL-OK' + 'y' * 100
+        assert matcher.match(StringIO(body)) == (25, 40)
+
+    def testBudget(self):
+        matcher = Matcher(maxBytes=1000, chunkSize=100)
+        assert matcher.match(StringIO('x' * 5000 + 'SCALL-OK')) == (None, 1000)
+
+    def testLargeBody(self):
+        server = StubServer(body='SCALL-OK' + 'x' * 1000000).start()
+        try:
+            result = probe('127.0.0.1', server.port, ConnectionPool())
+        finally:
+            server.stop()
+        assert result['status'] == 1
+        assert result['matchedAt'] == 0
+        assert result['bytesRead'] == 4096
+        assert result['bytesTotal'] == 1000008
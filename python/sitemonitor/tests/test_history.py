@@ -0,0 +1,94 @@
+import time
+import datetime as date
+
+from unittest import TestCase
+
+from sitemonitor.lib.app_globals import HistoryRecorder
+from sitemonitor.lib.histogram import Histogram
+from sitemonitor.model import HealthHistory, HealthRollup, meta
+from sitemonitor.tests import *
+
+HOST_ID  = 9001
+HOST_IDS = range(9001, 9011)
+
+class TestHistory(TestCase):
+    """The unit tests for the health check history and its rollups."""
+
+    def tearDown(self):
+        meta.Session.query(HealthHistory).filter(HealthHistory.hostId.in_(HOST_IDS)).delete(synchronize_session=False)
+        meta.Session.query(HealthRollup).filter(HealthRollup.hostId.in_(HOST_IDS)).delete(synchronize_session=False)
+        meta.Session.commit()
+        meta.Session.remove()
+
+    def record(self, checked, status, latency):
+        HealthHistory().recordResults({
+            HOST_ID: {
+                'status': status,
+                'latency': latency,
+                'checked': time.mktime(checked.timetuple()),
+                'error': None,
+            }
+        })
+        meta.Session.commit()
+
+    def testRollups(self):
+        now = date.datetime.now().replace(second=30, microsecond=0)
+        for i in range(10):
+            self.record(now, 1, 0.01 * (i + 1))
+        self.record(now, 0, None)
+        self.record(now - date.timedelta(days=1), 0, None)
+        assert len(HealthHistory().getByHostId(HOST_ID)) == 12
+        for size in HealthRollup.BUCKETS:
+            rollup = HealthRollup().getByHostId(HOST_ID, size, now.replace(hour=0, minute=0, second=0))[-1]
+            assert rollup.successCount == 10
+            assert rollup.failureCount == 1
+            assert rollup.latencyMin == 0.01
+            assert rollup.latencyMax == 0.1
+            assert abs(rollup.getLatencyAvg() - 0.055) < 0.0001
+            assert 0.09 <= rollup.latencyP95 <= 0.11
+        assert len(HealthRollup().getByHostId(HOST_ID, HealthRollup.DAY)) == 2
+        assert abs(HealthRollup().getUptime(HOST_ID, 30) - 100.0 * 10 / 12) < 0.0001
+        assert abs(HealthRollup().getUptime(HOST_ID, 1) - 100.0 * 10 / 11) < 0.0001
+        assert HealthRollup().getUptimes([ HOST_ID, 9002 ], 30).keys() == [ HOST_ID ]
+
+    def testCycle(self):
+        """ a cycle of results reads the rollups of all of its hosts with one query """
+        checked    = time.time()
+        results    = dict([ (id, { 'status': 1, 'latency': 0.01, 'checked': checked, 'error': None }) for id in HOST_IDS ])
+        HealthHistory().recordResults(results)
+        meta.Session.commit()
+        log = StatementLog(lambda statement: statement.startswith('SELECT') and 'HEALTH_ROLLUP' in statement).start()
+        try:
+            HealthHistory().recordResults(results)
+            meta.Session.commit()
+        finally:
+            log.stop()
+        assert len(log.statements) == 1
+        for id in HOST_IDS:
+            rollup = HealthRollup().getByHostId(id, HealthRollup.MINUTE)[-1]
+            assert rollup.successCount == 2
+
+    def testPurge(self):
+        """ the raw samples and rollups past their retention go, the daily rollups stay """
+        now = date.datetime.now()
+        self.record(now - date.timedelta(days=10), 1, 0.01)
+        self.record(now, 1, 0.01)
+        HistoryRecorder(raw=2, minute=7, hour=90).purge(now)
+        assert len(HealthHistory().getByHostId(HOST_ID)) == 1
+        assert len(HealthRollup().getByHostId(HOST_ID, HealthRollup.MINUTE)) == 1
+        assert len(HealthRollup().getByHostId(HOST_ID, HealthRollup.HOUR)) == 2
+        assert len(HealthRollup().getByHostId(HOST_ID, HealthRollup.DAY)) == 2
+
+
+class TestHistogram(TestCase):
+    """The unit tests for the log-bucketed latency histogram."""
+
+    def testPercentile(self):
+        histogram = Histogram()
+        for i in range(1, 101):
+            histogram.add(i / 1000.0)
+        assert 0.045 <= histogram.percentile(0.5) <= 0.056
+        assert 0.094 <= histogram.percentile(0.99) <= 0.11
+        merged = Histogram().fromString(histogram.toString()).merge(histogram)
+        assert merged.total == 200
+        assert merged.percentile(0.5) == histogram.percentile(0.5)
@@ -0,0 +1,83 @@
+import threading
+
+from unittest import TestCase
+
+from sitemonitor.model import Monitor, meta
+from sitemonitor.model.ids import IdAllocator, SequenceSource, TableSource, idBlock
+from sitemonitor.tests import *
+
+class CountingSource(TableSource):
+
+    def __init__(self):
+        TableSource.__init__(self)
+        self.calls = 0
+
+    def reserve(self, connection, table, size):
+        self.calls += 1
+        return TableSource.reserve(self, connection, table, size)
+
+
+class SequenceConnection:
+    """ an Oracle connection with an existing sequence, it only answers the increment and NEXTVAL """
+
+    def __init__(self, increment, value):
+        self.dialect   = self
+        self.name      = 'oracle'
+        self.increment = increment
+        self.value     = value
+
+    def has_sequence(self, connection, name):
+        return True
+
+    def execute(self, statement, **params):
+        if params:
+            return self
+        self.value += self.increment
+        return self.value - self.increment
+
+    def scalar(self):
+        return self.increment
+
+
+class TestIds(TestCase):
+    """The unit tests for the block id allocator."""
+
+    def testBlocks(self):
+        source    = CountingSource()
+        allocator = IdAllocator(source, blockSize=10, engine=meta.engine)
+        first     = allocator.nextId(Monitor)
+        ids       = [ first ] + [ allocator.nextId(Monitor) for i in range(9) ]
+        assert ids == range(first, first + 10)
+        assert source.calls == 1
+        bulk = allocator.nextIds(Monitor, 25)
+        assert len(set(bulk)) == 25
+        assert source.calls == 2
+        assert min(bulk) > max(ids)
+
+    def testSeed(self):
+        """ a table without an ID_BLOCK row starts past the ids it already has """
+        meta.engine.execute(idBlock.delete().where(idBlock.c.TABLE_NAME == Monitor.__tablename__))
+        maxId = meta.engine.execute('SELECT MAX(MONITOR_ID) FROM MONITOR').scalar() or 0
+        assert IdAllocator(blockSize=5, engine=meta.engine).nextId(Monitor) == maxId + 1
+
+    def testConcurrent(self):
+        """ two allocators are two processes sharing the table, neither hands out an id twice """
+        allocators = [ IdAllocator(blockSize=3, engine=meta.engine) for i in range(2) ]
+        ids        = [ ]
+        def allocate(allocator):
+            for i in range(20):
+                ids.append(allocator.nextId(Monitor))
+        threads = [ threading.Thread(target=allocate, args=(allocators[i % 2], )) for i in range(6) ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(ids) == 120
+        assert len(set(ids)) == 120
+
+    def testExistingSequence(self):
+        """ a sequence that already exists is reserved from by its own increment, not ids.block """
+        source     = SequenceSource(100)
+        connection = SequenceConnection(20, 501)
+        assert source.reserve(connection, Monitor.__table__, 100) == (501, 20)
+        assert source.reserve(connection, Monitor.__table__, 100) == (521, 20)
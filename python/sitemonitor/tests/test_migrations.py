@@ -0,0 +1,36 @@
+from unittest import TestCase
+
+from sitemonitor.model import Site, Host, Preference, meta
+from sitemonitor.model.migrations import MIGRATIONS, getQueryPlan, getVersion, migrate, schemaVersion
+from sitemonitor.tests import *
+
+class TestMigrations(TestCase):
+    """The unit tests for the schema migrations and the lookup indexes they add."""
+
+    def tearDown(self):
+        meta.Session.remove()
+
+    def testRepeatable(self):
+        """ websetup already migrated the test database, running again changes nothing """
+        assert migrate(meta.engine) == [ ]
+        assert getVersion(meta.engine) == MIGRATIONS[-1][0]
+
+    def testExistingSchema(self):
+        """ a schema created before the indexes gets them from the migration """
+        meta.engine.execute('DROP INDEX IX_HOST_VIP_NAME')
+        meta.engine.execute(schemaVersion.delete())
+        assert migrate(meta.engine) == [ version for version, description, function in MIGRATIONS ]
+        assert 'IX_HOST_VIP_NAME' in ' '.join(getQueryPlan(meta.Session.query(Host).filter_by(vip='VIP-ZZ')))
+
+    def testQueryPlans(self):
+        """ none of the hot lookups scan their table """
+        queries = [
+            Site().getQuery().filter_by(countryCode='ZZ', endPoint='statustest'),
+            meta.Session.query(Host).filter_by(vip='VIP-ZZ'),
+            meta.Session.query(Host).filter_by(name='host.test', port=8080),
+            meta.Session.query(Preference).filter_by(siteId=900),
+        ]
+        for query in queries:
+            plan = getQueryPlan(query)
+            for detail in plan:
+                assert 'USING' in detail, (str(query), plan)
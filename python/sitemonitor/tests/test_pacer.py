@@ -0,0 +1,75 @@
+import time
+import threading
+
+from unittest import TestCase
+
+from sitemonitor.lib.healthcheck import HealthCheck, StatusStore, Scheduler
+from sitemonitor.lib.pacer import Pacer, TokenBucket
+from sitemonitor.lib.stubs import StubServer
+from sitemonitor.tests import *
+
+class TestPacer(TestCase):
+    """The unit tests for jittered, rate limited probe scheduling."""
+
+    def release(self, targets, vips=None, pacer=None):
+        """ the time each target was released at, by target """
+        times = { }
+        pacer.run(targets, vips, lambda target: times.setdefault(target, time.time()), threading.Event())
+        return times
+
+    def testJitter(self):
+        pacer   = Pacer(interval=30, spread=0.5)
+        targets = [ ('host%d'%i, 80) for i in range(50) ]
+        offsets = [ pacer.getOffset(target) for target in targets ]
+        assert offsets == [ Pacer(30, 0.5).getOffset(target) for target in targets ]
+        assert 0 <= min(offsets) and max(offsets) < 15
+        assert max(offsets) - min(offsets) > 10
+
+    def testVipBudget(self):
+        """ ten hosts behind one VIP at 20/s take half a second, another VIP due behind them is
+            released at once rather than when they have drained
+        """
+        targets = [ ('host%d'%i, 80) for i in range(10) ] + [ ('vip-b', 80) ]
+        vips    = dict([ (target, 'VIP-A') for target in targets[:10] ])
+        vips[targets[10]] = 'VIP-B'
+        pacer   = Pacer(interval=1, spread=0, vipRate=20)
+        start   = time.time()
+        times   = self.release(targets, vips, pacer)
+        assert len(times) == 11
+        assert 0.4 < time.time() - start < 0.7
+        assert 0.4 < max(times.values()) - start
+        assert times[targets[10]] - start < 0.1
+        metrics = pacer.getMetrics()
+        assert metrics['paced'] == 11
+        assert metrics['queueDepth'] >= 8
+        assert metrics['lagMax'] > 0.4
+
+    def testBucket(self):
+        bucket = TokenBucket(10)
+        assert bucket.getDelay() == 0
+        bucket.take()
+        assert 0.05 < bucket.getDelay() <= 0.1
+        assert TokenBucket(0).getDelay() == 0
+
+    def testScheduler(self):
+        """ a budget too small for the hosts drops what misses the deadline and says so in the
+            pacing metrics, a dropped host keeps its last result and is not recorded
+        """
+        server = StubServer().start()
+        try:
+            hosts    = [ StubHost(i + 1, name, server.port, 'VIP-A') for i, name in enumerate([ '127.0.0.1', 'localhost' ]) ]
+            store    = StatusStore()
+            previous = { 'status': 1, 'latency': 0.01, 'checked': time.time(), 'error': None }
+            store.update({ 2: previous })
+            recorded = [ ]
+            check    = HealthCheck(deadline=0.3, pacer=Pacer(interval=1, spread=0, rate=2))
+            Scheduler(check, store, lambda: hosts, recorder=recorded.append).runOnce()
+        finally:
+            server.stop()
+        assert store.get(1)['status'] == 1
+        assert store.get(2) is previous
+        assert recorded[0].keys() == [ 1 ]
+        assert [ event['id'] for event in store.waitEvents(0, 0.01) if event['type'] == 'host' ] == [ 2, 1 ]
+        pacing = store.getMetrics()['pacing']
+        assert pacing['paced'] == 1
+        assert pacing['dropped'] == 1
@@ -0,0 +1,84 @@
+import time
+import socket
+
+from unittest import TestCase
+
+from sitemonitor.lib.connectionpool import ConnectionPool
+from sitemonitor.lib.healthcheck import HealthCheck, probe
+from sitemonitor.lib.resolver import Resolver
+from sitemonitor.lib.stubs import StubServer
+from sitemonitor.tests import *
+
+class StubDns:
+    """ answers from a hash of addresses, counting the lookups """
+
+    def __init__(self, addresses=None, delay=0):
+        self.addresses = addresses or { }
+        self.delay     = delay
+        self.lookups   = 0
+
+    def __call__(self, name):
+        self.lookups += 1
+        if self.delay:
+            time.sleep(self.delay)
+        if not self.addresses.get(name):
+            raise socket.gaierror('Name or service not known')
+        return self.addresses[name]
+
+
+class TestResolver(TestCase):
+    """The unit tests for the health check DNS cache."""
+
+    def testCache(self):
+        dns      = StubDns({ 'web1': '10.0.0.1' })
+        resolver = Resolver(ttl=60, lookup=dns)
+        for i in range(5):
+            assert resolver.resolve('web1') == '10.0.0.1'
+        assert dns.lookups == 1
+        assert resolver.resolve('10.0.0.2') == '10.0.0.2'
+        assert dns.lookups == 1
+
+    def testNegative(self):
+        dns      = StubDns()
+        resolver = Resolver(negativeTtl=0.2, lookup=dns)
+        for i in range(3):
+            self.assertRaises(socket.gaierror, resolver.resolve, 'gone')
+        assert dns.lookups == 1
+        time.sleep(0.25)
+        self.assertRaises(socket.gaierror, resolver.resolve, 'gone')
+        assert dns.lookups == 2
+        resolver.setFallbacks({ 'gone': '10.0.0.9' })
+        assert resolver.resolve('gone') == '10.0.0.9'
+
+    def testRefresh(self):
+        """ past the refresh point the cached address answers while a lookup runs in the background """
+        dns      = StubDns({ 'web1': '10.0.0.1' })
+        resolver = Resolver(ttl=0.2, refresh=0.5, lookup=dns)
+        resolver.resolve('web1')
+        time.sleep(0.12)
+        dns.addresses['web1'] = '10.0.0.2'
+        assert resolver.resolve('web1') == '10.0.0.1'
+        time.sleep(0.05)
+        assert dns.lookups == 2
+        assert resolver.resolve('web1') == '10.0.0.2'
+
+    def testSlow(self):
+        dns      = StubDns({ 'web1': '10.0.0.1' }, delay=0.5)
+        resolver = Resolver(timeout=0.05, lookup=dns)
+        resolver.setFallbacks({ 'web1': '10.0.0.5' })
+        start = time.time()
+        assert resolver.resolve('web1') == '10.0.0.5'
+        assert time.time() - start < 0.2
+
+    def testFallbackProbe(self):
+        """ a host name that does not resolve is probed at its HOST_IP """
+        server = StubServer().start()
+        try:
+            pool   = ConnectionPool(resolver=Resolver(lookup=StubDns()))
+            check  = HealthCheck(pool=pool)
+            host   = StubHost(1, 'unresolvable.test', server.port, ip='127.0.0.1')
+            result = check.checkHosts([ host ])
+            assert result[1]['status'] == 1
+            assert probe('other.test', server.port, pool)['error'] == 'Name or service not known'
+        finally:
+            server.stop()
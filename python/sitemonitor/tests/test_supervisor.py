@@ -0,0 +1,79 @@
+import os
+import signal
+import tempfile
+
+from unittest import TestCase
+
+from sitemonitor.lib.healthcheck import HealthCheck, StatusStore, Scheduler
+from sitemonitor.lib.stubs import StubServer
+from sitemonitor.lib.supervisor import Supervisor, shardOf
+from sitemonitor.tests import *
+
+class CrashingHealthCheck(HealthCheck):
+    """ exits the worker process the first time it sees the crash port """
+
+    def __init__(self, port, marker):
+        HealthCheck.__init__(self)
+        self.port   = port
+        self.marker = marker
+
+    def check(self, name, port, matcher=None):
+        if port == self.port and not os.path.exists(self.marker):
+            open(self.marker, 'w').close()
+            os._exit(1)
+        return HealthCheck.check(self, name, port, matcher)
+
+
+class TestSupervisor(TestCase):
+    """The unit tests for the multi-process probe supervisor."""
+
+    def setUp(self):
+        self.servers = [ StubServer().start() for i in range(6) ]
+        self.hosts   = [ StubHost(i + 1, '127.0.0.1', self.servers[i].port) for i in range(6) ]
+
+    def tearDown(self):
+        for server in self.servers:
+            server.stop()
+
+    def testShards(self):
+        assert shardOf(('127.0.0.1', 80), 4) == shardOf(('127.0.0.1', 80), 4)
+        shards = set([ shardOf(('host%d'%i, 80), 4) for i in range(100) ])
+        assert shards == set([ 0, 1, 2, 3 ])
+
+    def testScheduler(self):
+        supervisor = Supervisor(3, HealthCheck, 10)
+        store      = StatusStore()
+        try:
+            Scheduler(supervisor, store, lambda: self.hosts).runOnce()
+        finally:
+            supervisor.stop()
+        assert sorted(store.results.keys()) == [ 1, 2, 3, 4, 5, 6 ]
+        for server in self.servers:
+            assert server.requests == 1
+        assert store.get(1)['status'] == 1
+
+    def testCrash(self):
+        """ the worker dies mid cycle, its replacement finishes the shard in the same cycle """
+        marker     = tempfile.mktemp()
+        port       = self.hosts[0].port
+        supervisor = Supervisor(2, lambda: CrashingHealthCheck(port, marker), 10)
+        store      = StatusStore()
+        try:
+            Scheduler(supervisor, store, lambda: self.hosts).runOnce()
+            assert supervisor.restarts == 1
+            assert len(store.results) == 6
+            for id, result in store.results.items():
+                assert result['status'] == 1
+            """ a worker killed between cycles is restarted before the next one """
+            os.kill(supervisor.processes[0].pid, signal.SIGKILL)
+            supervisor.processes[0].join()
+            store.results.clear()
+            Scheduler(supervisor, store, lambda: self.hosts).runOnce()
+            assert supervisor.restarts == 2
+            assert len(store.results) == 6
+            for id, result in store.results.items():
+                assert result['status'] == 1
+        finally:
+            supervisor.stop()
+            if os.path.exists(marker):
+                os.remove(marker)
@@ -4,6 +4,7 @@ import pylons.test
 
 from sitemonitor.config.environment import load_environment
 from sitemonitor.model import meta
+from sitemonitor.model.migrations import migrate
 
 log = logging.getLogger(__name__)
 
@@ -15,3 +16,6 @@ def setup_app(command, conf, vars):
 
     # Create the tables if they don't already exist
     meta.metadata.create_all(bind=meta.engine)
+
+    # Bring an existing schema up to date
+    migrate(meta.engine)